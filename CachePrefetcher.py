@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from ComboUsageTracker import make_combo_key
+
+
+class CachePrefetcher:
+    """
+    Idle-time cache warmer.
+
+    After a selection settles, precomputes query results for the labels the user
+    is most likely to click next (current selection + one visible label) and
+    stores them in ComboUsageTracker, so drill-down clicks hit the cache.
+    All candidates are computed with one CalibreEngine.query_batch call, which
+    evaluates the shared current selection once. Runs on a daemon thread and
+    stops as soon as cancel() is called.
+    """
+
+    def __init__(self, engine, usage_tracker, top_n=8):
+        self.engine = engine
+        self.usage_tracker = usage_tracker
+        self.top_n = top_n
+        self._cancel_event = None
+        self._thread = None
+
+    def start(self, selected_labels, candidates):
+        """
+        selected_labels: current set of (label, field) tuples.
+        candidates: (label, field, count) for the labels visible in the label pane.
+        """
+        self.cancel()
+        if not self.engine or not candidates:
+            return
+        cancel_event = threading.Event()
+        self._cancel_event = cancel_event
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(set(selected_labels), list(candidates), cancel_event,
+                  self.engine, self.usage_tracker.generation),
+            name="combo-cache-prefetch",
+            daemon=True
+        )
+        self._thread.start()
+
+    def cancel(self):
+        if self._cancel_event is not None:
+            self._cancel_event.set()
+            self._cancel_event = None
+
+    def rank(self, selected_labels, candidates):
+        """Order candidates by past usage of the label, then by its current count."""
+        history = self.usage_tracker.label_usage()
+        seen = set()
+        ranked = []
+        for label, field, count in candidates:
+            if (label, field) in selected_labels or (label, field) in seen or not count:
+                continue
+            seen.add((label, field))
+            ranked.append((history.get((field, label), 0), count, label, field))
+        ranked.sort(key=lambda item: (-item[0], -item[1], item[2]))
+        return [(label, field) for _, _, label, field in ranked[:self.top_n]]
+
+    def _run(self, selected_labels, candidates, cancel_event, engine, data_generation):
+        self._lower_thread_priority()
+        pending = []  # (combo_key, {field: [labels]}) not cached yet
+        for label, field in self.rank(selected_labels, candidates):
+            selection = selected_labels | {(label, field)}
+            combo_key = make_combo_key(selection)
+            if self.usage_tracker.contains(combo_key):
+                continue
+            labels_by_field_for_query = {}
+            for lbl, fld in selection:
+                labels_by_field_for_query.setdefault(fld, []).append(lbl)
+            pending.append((combo_key, labels_by_field_for_query))
+        if not pending or cancel_event.is_set():
+            return
+
+        started = time.perf_counter()
+        results = engine.query_batch([query for _, query in pending], cancel_event=cancel_event)
+        # An evicted entry is recomputed on a miss by QueryWorker's engine.query,
+        # a full library scan like this batch, so every entry is charged the
+        # batch time (about one scan), not its share; prefetched entries then
+        # weigh the same in eviction as ones QueryWorker stored
+        cost_ms = (time.perf_counter() - started) * 1000
+        if results is None or cancel_event.is_set():
+            return
+        # one backend write for the batch; dropped by the tracker if the
+        # library was reloaded since start()
+        self.usage_tracker.store_many(
+            [(combo_key, result, cost_ms) for (combo_key, _), result in zip(pending, results)],
+            generation=data_generation
+        )
+
+    def _lower_thread_priority(self):
+        # On Linux each thread has its own nice value, so this only affects the worker
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
@@ -1,9 +1,27 @@
 import json
 import os
 from collections import defaultdict
+from ExportWriter import read_export
+from FacetSnapshot import FacetSnapshot
+
+
+def export_version(library_dir):
+    """
+    Identifies the builder's last complete export in library_dir: the mtime of
+    metadata_timestamp.json, which the builder writes after every other file.
+    """
+    for name in ("metadata_timestamp.json", "semantic_label_map.json"):
+        try:
+            return os.path.getmtime(os.path.join(library_dir, name))
+        except OSError:
+            continue
+    return 0
+
 
 class CalibreEngine:
     def __init__(self, label_map_path, vocab_path, parser_path, label_groups_path="label_groups.json"):
+        # taken before reading, so an export finishing during the load still marks this engine stale
+        self.version = export_version(os.path.dirname(os.path.abspath(label_map_path)))
         self.label_map = self._load_json(label_map_path)
         self.dynamic_vocab = self._load_json(vocab_path)
         self.parser = self._load_json(parser_path)
@@ -24,6 +42,10 @@ class CalibreEngine:
         self._build_group_member_lookup()
         self._build_label_to_books_index()
     
+    def is_stale(self):
+        """True once the builder has finished a newer export than the one loaded."""
+        return export_version(os.path.dirname(os.path.abspath(self._label_map_path))) != self.version
+
     def _get_file_mtime(self, path):
         """Get file modification time, return 0 if file doesn't exist."""
         try:
@@ -96,8 +118,7 @@ class CalibreEngine:
                     self.group_member_lookup[member.lower()] = (field, group_name)
 
     def _load_json(self, path):
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return read_export(path)  # the builder's files may be compact or compressed
 
     def _build_normalized_parser_labels(self):
         labels = set()
@@ -141,7 +162,19 @@ class CalibreEngine:
                     return canonical
         return label
 
-    def query(self, input_labels):
+    def query(self, input_labels, cancel_event=None):
+        # cancel_event: optional threading.Event; when it is set the scan stops
+        # early and None is returned (used when a newer selection supersedes this one)
+        matched = self._match(input_labels, cancel_event)
+        if matched is None:
+            return None
+        results, include_labels = matched
+        if not include_labels:
+            return {"books": {}, "refinable_labels": {}, "query_labels": [], "refinement_closed": True}
+        return self._summarize_results(results, include_labels, cancel_event)
+
+    def _match(self, input_labels, cancel_event=None):
+        """(matched book records, include_labels) of a query, or None if cancelled."""
         # Support both old format (list of labels) and new format (dict {field: [labels]})
         # New format enables field-aware matching
         if isinstance(input_labels, dict):
@@ -158,10 +191,12 @@ class CalibreEngine:
             include_labels_by_field = None
         
         if not include_labels:
-            return {"books": {}, "refinable_labels": {}, "query_labels": [], "refinement_closed": True}
+            return {}, include_labels
 
         results = {}
         for book_id, entry in self.label_map.items():
+            if cancel_event is not None and cancel_event.is_set():
+                return None
             # Build label sets per field for field-aware matching
             labels_by_field = entry.get("labels_by_field", {})
             
@@ -220,17 +255,28 @@ class CalibreEngine:
                         "labels_by_field": normalized_by_field
                     }
 
+        return results, include_labels
+
+    def _summarize_results(self, results, include_labels, cancel_event=None):
+        """Refinable labels (series-deduplicated, per field) for the matched books of a query."""
+        field_series_tracker = self._refinement_entries(results, include_labels, cancel_event)
+        if field_series_tracker is None:
+            return None
+        return self._summary(results, include_labels, field_series_tracker)
+
+    def _refinement_entries(self, results, include_labels, cancel_event=None):
+        """{field: {label: series names / book ids carrying it}} over the matched books, or None if cancelled."""
         remaining_labels = set()
         for data in results.values():
             remaining_labels.update(data["labels"])
         remaining_labels -= include_labels
 
-        refinable_labels = []
-        
         # Track refinements per field: {field: {label: set of series_keys}}
         field_series_tracker = defaultdict(lambda: defaultdict(set))
 
         for label in sorted(remaining_labels):
+            if cancel_event is not None and cancel_event.is_set():
+                return None
             for book_id, data in results.items():
                 series_name = data.get("series")
                 unique_key = series_name.lower() if series_name else book_id
@@ -241,6 +287,10 @@ class CalibreEngine:
                     if label in field_labels and include_labels.issubset(data["labels"]):
                         # This label exists in this specific field
                         field_series_tracker[field][label].add(unique_key)
+        return field_series_tracker
+
+    def _summary(self, results, include_labels, field_series_tracker):
+        refinable_labels = []
 
         # Now process each field's tracker
         for field, label_tracker in field_series_tracker.items():
@@ -278,6 +328,133 @@ class CalibreEngine:
             "refinement_closed": refinement_closed
         }
 
+    def query_batch(self, selections, cancel_event=None):
+        """
+        Run many field-aware queries ({field: [labels]} each) in one go.
+
+        Returns the same result as query() for every selection, in order, but
+        shares the work between them: the library is scanned (and its labels
+        normalized) once for the whole batch, every distinct (field, label)
+        requirement gets one posting set, and the selections are evaluated as
+        chains of intersections ordered by how many selections share each
+        requirement, so a common sub-selection (e.g. the current selection when
+        the batch is "current selection + each candidate") is intersected once.
+        Returns None if cancel_event is set before it finishes.
+        """
+        matched = self._match_batch(selections, cancel_event)
+        if matched is None:
+            return None
+        batch_results = []
+        for results, include_labels in matched:
+            if not include_labels:
+                batch_results.append({"books": {}, "refinable_labels": {}, "query_labels": [], "refinement_closed": True})
+                continue
+            summary = self._summarize_results(results, include_labels, cancel_event)
+            if summary is None:
+                return None
+            batch_results.append(summary)
+        return batch_results
+
+    def query_parts(self, selections, tag=None, cancel_event=None):
+        """
+        query_batch() without the final refinement filtering: per selection
+        (books, include_labels, refinement entries), for FederatedEngine to merge
+        across libraries. With a tag, book ids become "tag:book_id" and every
+        record gets "library": tag.
+        """
+        matched = self._match_batch(selections, cancel_event)
+        if matched is None:
+            return None
+        parts = []
+        for results, include_labels in matched:
+            if tag is not None:
+                results = {f"{tag}:{book_id}": dict(data, library=tag) for book_id, data in results.items()}
+            entries = self._refinement_entries(results, include_labels, cancel_event) if include_labels else {}
+            if entries is None:
+                return None
+            # plain dicts: the parts are pickled back from a library's worker process
+            parts.append((results, include_labels, {field: dict(labels) for field, labels in entries.items()}))
+        return parts
+
+    def _match_batch(self, selections, cancel_event=None):
+        """Per selection (matched book records, include_labels), or None if cancelled."""
+        requirements = []  # per selection: set of (field, label)
+        for selection in selections:
+            required = set()
+            for field, labels in selection.items():
+                for label in labels:
+                    if label.strip():
+                        required.add((field, label.strip().lower()))
+            requirements.append(required)
+
+        shared_by = defaultdict(int)
+        for required in requirements:
+            for requirement in required:
+                shared_by[requirement] += 1
+
+        # One pass over the library: postings of every requirement in the batch
+        postings = {requirement: set() for requirement in shared_by}
+        fields = {field for field, _ in shared_by}
+        records = {}  # book_id -> result record, only for books matching some requirement
+        for book_id, entry in self.label_map.items():
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            labels_by_field = entry.get("labels_by_field", {})
+            matched = False
+            for field in fields.intersection(labels_by_field):
+                for label in labels_by_field[field]:
+                    posting = postings.get((field, self.normalize_label(field, label).strip().lower()))
+                    if posting is not None:
+                        posting.add(book_id)
+                        matched = True
+            if matched:
+                normalized_by_field = {
+                    field: [self.normalize_label(field, label).strip().lower() for label in field_labels]
+                    for field, field_labels in labels_by_field.items()
+                }
+                label_set = set()
+                for field_labels in normalized_by_field.values():
+                    label_set.update(field_labels)
+                records[book_id] = {
+                    "author": entry.get("author", "Unknown"),
+                    "labels": label_set,
+                    "series": entry.get("series"),
+                    "labels_by_field": normalized_by_field
+                }
+
+        order = {book_id: position for position, book_id in enumerate(records)}
+
+        # Most shared requirements first, so related selections share their prefixes
+        intersections = {(): None}  # sorted requirement prefix -> matching book ids
+        matched = []
+        for required in requirements:
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            if not required:
+                matched.append(({}, set()))
+                continue
+            chain = sorted(required, key=lambda r: (-shared_by[r], r))
+            for depth in range(1, len(chain) + 1):
+                prefix = tuple(chain[:depth])
+                if prefix not in intersections:
+                    parent = intersections[prefix[:-1]]
+                    posting = postings[prefix[-1]]
+                    intersections[prefix] = set(posting) if parent is None else parent & posting
+            # library order, like query()
+            book_ids = sorted(intersections[tuple(chain)], key=order.__getitem__)
+            results = {book_id: records[book_id] for book_id in book_ids}
+            matched.append((results, {label for _, label in required}))
+        return matched
+
+    def facet_snapshot(self, book_ids=None):
+        """FacetSnapshot of book_ids (all books when None)."""
+        if book_ids is None:
+            book_ids = self.label_map.keys()
+        return FacetSnapshot(self.label_map, book_ids)
+
+    def preload_books(self, book_ids):
+        """Nothing to do in-process; RemoteEngine fetches the records of book_ids in one round trip."""
+
     def get_all_labels(self):
         all_labels = set()
         for field in self.dynamic_vocab:
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Headless query mode: runs CalibreEngine queries without the TUI and writes
+one JSON object per query (JSON Lines) to stdout.
+
+    python3 CalibreSynapseQuery.py "Themes:found family" "Genre:fantasy"
+    python3 CalibreSynapseQuery.py < queries.txt > results.jsonl
+
+If an EngineDaemon.py daemon serves the library, queries go to it and the
+engine isn't loaded here at all. A --library-dir holding a libraries.json is
+queried as a federation (FederatedEngine.py); its books carry a "library" tag.
+
+Command-line selections (field:label) form a single query. Without them,
+queries are read from stdin, one per line: tab-separated field:label items,
+or a JSON array of [field, label] pairs. Stdin queries are run in batches
+through CalibreEngine.query_batch, which shares the library scan and common
+sub-selections; each record's elapsed_ms is its share of the batch. A batch
+is run as soon as stdin has no further line ready, so a process feeding
+queries one at a time gets every answer right away. The
+engine is loaded once; load time and throughput (queries per second) are
+reported on stderr.
+"""
+import argparse
+import json
+import os
+import select
+import sys
+import time
+from EngineDaemon import RemoteEngine, open_engine
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def parse_selection(item):
+    """'field:label' -> (field, label). Only the first colon separates them."""
+    field, sep, label = item.partition(":")
+    if not sep or not field.strip() or not label.strip():
+        raise ValueError(f"expected field:label, got {item!r}")
+    return field.strip(), label.strip()
+
+
+def parse_query_line(line):
+    line = line.strip()
+    if line.startswith("["):
+        return [(field, label) for field, label in json.loads(line)]
+    return [parse_selection(item) for item in line.split("\t") if item.strip()]
+
+
+def read_ready_lines(fd):
+    """
+    Non-empty lines read from fd, with None yielded whenever no complete line
+    is ready without blocking (the writer is waiting for answers).
+    """
+    pending = b""
+    while True:
+        if b"\n" not in pending and not select.select([fd], [], [], 0)[0]:
+            yield None
+        chunk = os.read(fd, 65536) if b"\n" not in pending else b""
+        if not chunk and b"\n" not in pending:
+            if pending.strip():
+                yield pending.decode("utf-8")
+            return
+        pending += chunk
+        *complete, pending = pending.split(b"\n")
+        for line in complete:
+            if line.strip():
+                yield line.decode("utf-8")
+
+
+def read_batches(lines, batch_size):
+    """
+    Group input lines into lists of (line, selections), or (line, error) for
+    malformed lines. A None in lines ends the current batch early.
+    """
+    batch = []
+    for line in lines:
+        if line is None:
+            if batch:
+                yield batch
+                batch = []
+            continue
+        if isinstance(line, list):
+            batch.append((None, line))
+        else:
+            try:
+                batch.append((line.strip(), parse_query_line(line)))
+            except (ValueError, TypeError) as e:
+                batch.append((line.strip(), e))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def series_key(engine, book_id, data):
+    """Books of one series count once; standalone books (and "standalone novels") count individually."""
+    series = (data.get("series") or engine.label_map.get(book_id, {}).get("series") or "").strip().lower()
+    if series and series != "standalone novels":
+        return ("series", series)
+    return ("book", book_id)
+
+
+def labels_by_field(selections):
+    query = {}
+    for field, label in selections:
+        query.setdefault(field, []).append(label)
+    return query
+
+
+def run_batch(engine, batch, with_books=True):
+    """Records for a list of selections, computed with one query_batch call."""
+    started = time.perf_counter()
+    results = engine.query_batch([labels_by_field(selections) for selections in batch])
+    elapsed_ms = (time.perf_counter() - started) * 1000 / len(batch)
+    engine.preload_books({book_id for result in results for book_id in result.get("books", {})})
+    return [make_record(engine, selections, result, elapsed_ms, with_books)
+            for selections, result in zip(batch, results)]
+
+
+def make_record(engine, selections, result, elapsed_ms, with_books=True):
+    books = result.get("books", {})
+    record = {
+        "query": [[field, label] for field, label in selections],
+        "book_count": len(books),
+        "count": len({series_key(engine, book_id, data) for book_id, data in books.items()}),
+        "refinements": {
+            field: [[label, count] for label, count in labels]
+            for field, labels in result.get("refinable_labels", {}).items()
+        },
+        "elapsed_ms": round(elapsed_ms, 3)
+    }
+    if with_books:
+        record["books"] = sorted(
+            (
+                {
+                    "id": book_id,
+                    "title": engine.label_map.get(book_id, {}).get("title", ""),
+                    "author": data.get("author", "Unknown"),
+                    "series": data.get("series"),
+                    **({"library": data["library"]} if data.get("library") else {})
+                }
+                for book_id, data in books.items()
+            ),
+            key=lambda book: (book["title"] or "").lower()
+        )
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the CalibreSynapse index without the TUI (JSON Lines output).")
+    parser.add_argument("selections", nargs="*", metavar="FIELD:LABEL",
+                        help="one query made of these selections; omit to read queries from stdin")
+    parser.add_argument("--library-dir", default=SCRIPT_DIR,
+                        help="directory holding semantic_label_map.json and friends (default: next to this script)")
+    parser.add_argument("--no-books", action="store_true",
+                        help="leave out the book list (counts and refinements only)")
+    parser.add_argument("--batch-size", type=int, default=64,
+                        help="stdin queries evaluated together (default: 64; 1 runs them one by one)")
+    args = parser.parse_args(argv)
+
+    if args.selections:
+        try:
+            lines = [[parse_selection(item) for item in args.selections]]
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        lines = read_ready_lines(sys.stdin.fileno())
+
+    started = time.perf_counter()
+    engine = open_engine(args.library_dir)
+    source = "connected to daemon" if isinstance(engine, RemoteEngine) else "loaded"
+    print(f"✅ Engine {source} in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+
+    loop_started = time.perf_counter()
+    done = 0
+    failed = 0
+    query_seconds = 0.0
+    for batch in read_batches(lines, max(1, args.batch_size)):
+        valid = [selections for _, selections in batch if not isinstance(selections, Exception)]
+        records = iter(run_batch(engine, valid, with_books=not args.no_books) if valid else [])
+        # output stays in input order, malformed lines included
+        for line, selections in batch:
+            if isinstance(selections, Exception):
+                failed += 1
+                print(json.dumps({"error": str(selections), "input": line}, ensure_ascii=False), flush=True)
+                continue
+            record = next(records)
+            query_seconds += record["elapsed_ms"] / 1000
+            done += 1
+            print(json.dumps(record, ensure_ascii=False), flush=True)
+
+    wall_seconds = time.perf_counter() - loop_started
+    rate = done / wall_seconds if wall_seconds else 0.0
+    engine_rate = done / query_seconds if query_seconds else 0.0
+    print(f"📊 {done} queries ({failed} rejected) in {wall_seconds:.3f}s — {rate:.1f} queries/s "
+          f"({engine_rate:.1f}/s engine time only)", file=sys.stderr)
+    return 0 if not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
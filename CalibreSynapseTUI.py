@@ -1,24 +1,64 @@
 
 import os
 import sys
+import time
+
+# Reference point for --startup-profile (taken before the heavy imports below)
+STARTUP_T0 = time.perf_counter()
 
 # Get the directory where this script is located
 SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 
+# Combo cache storage: "json" (combo_usage_cache.json, loaded whole at startup)
+# or "sqlite" (combo_usage_cache.sqlite, one row per combo read on demand)
+COMBO_CACHE_BACKEND = "json"
+
+# Seconds the label pane must stay unchanged before likely next selections are precomputed
+PREFETCH_IDLE_DELAY = 0.5
+
+# Facet snapshots (per-selection label counts) kept in memory for quick back/forth
+FACET_SNAPSHOT_CACHE_SIZE = 16
+
+# Seconds without keyboard/mouse input after which the book animation stops
+# and the clock drops to one update per minute (both resume on the next input)
+IDLE_TIMEOUT = 60
+
+# Seconds between checks for a newer export of the library (or a daemon reload);
+# checks ride on the clock tick, so an idle session checks once a minute
+LIBRARY_CHECK_INTERVAL = 5
+
+# Book Feeds pane: fetched concurrently, each feed given at most FEED_TIMEOUT seconds
+FEED_URLS = [
+    "https://www.theguardian.com/books/rss",
+    "https://rss.nytimes.com/services/xml/rss/nyt/Books.xml",
+    "https://www.tor.com/feed/",
+    "https://lithub.com/feed/",
+    "https://www.goodreads.com/blog/feed"
+]
+FEED_TIMEOUT = 10
+# Cached feeds are shown at startup and only re-requested (conditionally) after this many seconds
+FEED_CACHE_TTL = 30 * 60
+
 #!/usr/bin/env python3
 # v. 1.6.1 (patched - description popup + clock)
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 import urwid
 import json
-import pyfiglet
+import hashlib
 import itertools
-import feedparser
 import logging
 import re
+import threading
 from datetime import datetime
-from CalibreEngine import CalibreEngine
-from ComboUsageTracker import ComboUsageTracker
+from ComboUsageTracker import ComboUsageTracker, make_combo_key, make_group_key
+from CachePrefetcher import CachePrefetcher
+from LabelListWalker import LabelListWalker
+from QueryWorker import QueryWorker
+from FeedLoader import FeedCache, FeedLoader
+from ExportWriter import read_export
+
+STARTUP_IMPORTS_DONE = time.perf_counter()
 
 class SearchEdit(urwid.Edit):
     def __init__(self, callback, *args, **kwargs):
@@ -33,12 +73,36 @@ class SearchEdit(urwid.Edit):
             return None  # Don't pass Enter to parent
         return super().keypress(size, key)
 
+class MeteredScreen(urwid.display.raw.Screen):
+    """Terminal screen that counts redraws and bytes written, for ui_activity_stats.json."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.redraws = 0
+        self.bytes_written = 0
+        self.first_draw_done = None  # perf_counter() when the first frame was written
+
+    def draw_screen(self, size, canvas):
+        self.redraws += 1
+        super().draw_screen(size, canvas)
+        if self.first_draw_done is None:
+            self.first_draw_done = time.perf_counter()
+
+    def write(self, data):
+        self.bytes_written += len(data.encode("utf-8", "replace")) if isinstance(data, str) else len(data)
+        super().write(data)
+
 def extract_first_link(html):
     match = re.search(r'href="([^"]+)"', html)
     if match:
         return match.group(1)
     return None
 
+def library_tag(data):
+    """Title row suffix naming the library of a book served by a FederatedEngine."""
+    library = (data or {}).get("library")
+    return f" [{library}]" if library else ""
+
 logging.basicConfig(
     filename=os.path.join(SCRIPT_DIR, 'calibre_ui.log'),
     level=logging.ERROR,
@@ -46,26 +110,40 @@ logging.basicConfig(
 )
 
 class CalibreUI:
-    def __init__(self):
-        try:
-            self.engine = CalibreEngine(
-                label_map_path=os.path.join(SCRIPT_DIR, "semantic_label_map.json"),
-                vocab_path=os.path.join(SCRIPT_DIR, "dynamic_vocabulary.json"),
-                parser_path=os.path.join(SCRIPT_DIR, "vocabulary_parser.json"),
-                label_groups_path=os.path.join(SCRIPT_DIR, "label_groups.json")
-            )
-        except Exception as e:
-            print(f"❌ Engine failed: {e}")
-            self.engine = None
+    def __init__(self, startup_profile=False, write_stats=False):
+        # --startup-profile: seconds spent in each startup phase, reported once the UI is ready
+        self.startup_profile = startup_profile
+        # --stats: save usage statistics of the session on exit
+        self.write_stats = write_stats
+        self.startup_phases = {"imports": STARTUP_IMPORTS_DONE - STARTUP_T0}
+        phase_started = time.perf_counter()
+
+        # The engine is built on a worker thread once the loop exists (_start_engine_load);
+        # until then the label pane lists the field names from dynamic_vocabulary.json
+        self.engine = None
+        self.engine_loading = True
+        self._loaded_engine = None
+        self._early_fields = self._read_field_names()
 
         self.in_search_mode = False
-        self.cache_path = os.path.join(SCRIPT_DIR, "combo_usage_cache.json")
+        cache_ext = "sqlite" if COMBO_CACHE_BACKEND == "sqlite" else "json"
+        cache_namespace, self.fingerprints_path, self.library_dirs = self._cache_sources()
+        self.cache_path = os.path.join(SCRIPT_DIR, f"combo_usage_cache{cache_namespace}.{cache_ext}")
         self._invalidate_stale_cache()  # Check if cache is stale before loading
-        self.usage_tracker = ComboUsageTracker(self.cache_path)
+        self.usage_tracker = ComboUsageTracker(self.cache_path, backend=COMBO_CACHE_BACKEND,
+                                               fingerprints_path=self.fingerprints_path)
+        phase_started = self._end_startup_phase("cache_load", phase_started)
         self._split_cache = {}
         self._page_cache = {}
         self._refinement_cache = {}
         self._filtered_label_cache = {}
+        self._facet_snapshots = {}  # combo key -> FacetSnapshot of its result books
+        self._last_result = None  # (combo_key, result) currently shown in the Titles pane
+
+        # cache warmer for likely next selections (visible labels in expanded fields)
+        self.prefetcher = CachePrefetcher(self.engine, self.usage_tracker)
+        self._prefetch_alarm = None
+        self._prefetch_candidates = []
 
         self.selected_labels = set()  # stores (label, field) tuples
         self.expanded_categories = {}
@@ -110,7 +188,8 @@ class CalibreUI:
 
         self.selected_text = urwid.Text("📖 Welcome to CalibreSynapse — where genre meets depth.")
         self.search_edit = SearchEdit(self.perform_search, "🔎 Search Label: ")
-        self.label_listbox = urwid.ListBox(urwid.SimpleFocusListWalker([]))
+        self.label_walker = LabelListWalker(self._make_label_row_widget, self._update_label_row_widget)
+        self.label_listbox = urwid.ListBox(self.label_walker)
         self.title_listbox = urwid.ListBox(urwid.SimpleFocusListWalker([]))
         self.suggestion_listbox = urwid.ListBox(urwid.SimpleFocusListWalker([
             urwid.Text("📚 Loading suggestions...")
@@ -131,7 +210,7 @@ class CalibreUI:
         )
 
         self.rotating_book_widget = urwid.Text("")
-        footer_text_line1 = urwid.Text("🔍 Q: Quit | C: Clear | U: Undo | G: Group Labels | Esc, P: Close Pop-up | ↑↓: Navigate | -/+: Page | Enter: Select | T: Toggle Feeds")
+        footer_text_line1 = urwid.Text("🔍 Q: Quit | C: Clear | U: Undo | R: Reload Library | G: Group Labels | Esc, P: Close Pop-up | ↑↓: Navigate | -/+: Page | Enter: Select | T: Toggle Feeds")
         footer_text_line2 = urwid.Text("🟦 Blue = Standalone Book | 🟩 Green = Series")
         footer_text_widget = urwid.Pile([footer_text_line1, footer_text_line2])
 
@@ -171,41 +250,273 @@ class CalibreUI:
         )
 
         print("✅ Reached loop setup")
-        self.loop = urwid.MainLoop(self.layout, palette=self.themes[self.current_theme], unhandled_input=self.handle_input, handle_mouse=True)
+        self.loop = urwid.MainLoop(self.layout, palette=self.themes[self.current_theme], unhandled_input=self.handle_input,
+                                   input_filter=self._filter_input, handle_mouse=True, screen=MeteredScreen())
         self.build_theme_bar()
+        # live queries run off the UI thread; results come back through a watched pipe
+        self.query_worker = QueryWorker(self.engine, self.usage_tracker, self.loop, self._show_query_result)
         self.frame_gen = self.book_frames()
-        self.loop.set_alarm_in(0.1, self.animate_book)
-        self.loop.set_alarm_in(0.2, lambda loop, data: self.refresh_suggestions())
+
+        # idle tracking: timers stop redrawing when nobody is at the keyboard
+        self._started = time.monotonic()
+        self._last_input = self._started
+        self.wakeups = 0  # timer callbacks run (animation + clock)
+        self._animation_alarm = self.loop.set_alarm_in(0.1, self.animate_book)
+        self._clock_alarm = None
+        self._clock_idle = False
+        self._engine_reloading = False
+        self._library_checked = time.monotonic()
+        self.feed_cache = FeedCache(os.path.join(SCRIPT_DIR, "rss_feed_cache.json"), ttl=FEED_CACHE_TTL)
+        self.feed_loader = FeedLoader(self.loop, self._on_feed_loaded, timeout=FEED_TIMEOUT, cache=self.feed_cache)
+        self._feed_items = {}  # url -> widgets of the feeds loaded so far
+        self.loop.set_alarm_in(0, lambda loop, data: self.refresh_suggestions())
 
         # start clock updater (every second)
         self.update_clock(None, None)
 
-        self.build_label_list()
+        # state changes only mark what is dirty; one render pass runs per loop iteration
+        self._dirty = set()
+        self._render_alarm = None
+        phase_started = self._end_startup_phase("widgets", phase_started)
+
+        self.update_titles()  # shows the loading state until the engine is ready
+        self._start_engine_load()
+
+    def _read_field_names(self):
+        """Field names for the label pane while the engine loads (the vocabulary file is small)."""
+        try:
+            return sorted(read_export(os.path.join(SCRIPT_DIR, "dynamic_vocabulary.json")).keys())
+        except Exception:
+            return []
+
+    def _start_engine_load(self):
+        self._engine_pipe = self.loop.watch_pipe(self._on_engine_loaded)
+        threading.Thread(target=self._load_engine, name="engine-load", daemon=True).start()
+
+    def _load_engine(self):
+        """Runs on the engine-load thread."""
+        started = time.perf_counter()
+        self._loaded_engine = None
+        try:
+            # imported here so the engine modules load off the UI thread too
+            from EngineDaemon import open_engine
+            # an EngineDaemon.py daemon for this library makes this a connect instead of a load
+            self._loaded_engine = open_engine(SCRIPT_DIR)
+        except Exception as e:
+            logging.error("Engine failed", exc_info=True)
+            print(f"❌ Engine failed: {e}")
+        if self.engine_loading:
+            self.startup_phases["engine_load"] = time.perf_counter() - started
+        os.write(self._engine_pipe, b"\n")
+
+    def _on_engine_loaded(self, data):
+        """Back on the UI thread: enable the label and title panes."""
+        if not self.engine_loading:
+            self._swap_engine(self._loaded_engine)
+            os.close(self._engine_pipe)
+            return False
+        started = time.perf_counter()
+        self.engine = self._loaded_engine
+        self.engine_loading = False
+        self.prefetcher.engine = self.engine
+        self.query_worker.engine = self.engine
+        if self.in_search_mode:
+            self.perform_search(self.search_query)
+        self.update_titles()  # also builds the label list
+        self._end_startup_phase("initial_view", started)
+        self.startup_phases["time_to_ready"] = time.perf_counter() - STARTUP_T0
+        os.close(self._engine_pipe)
+        return False  # one-shot: urwid closes the read end
+
+    def _check_library(self):
+        """Reload the engine in the background once a newer export of the library is available."""
+        now = time.monotonic()
+        if self.engine is None or self._engine_reloading or now - self._library_checked < LIBRARY_CHECK_INTERVAL:
+            return
+        self._library_checked = now
+        try:
+            stale = self.engine.is_stale()
+        except Exception as e:
+            logging.error(f"Library check failed: {e}")
+            return
+        if stale:
+            self.reload_engine()
+
+    def reload_engine(self):
+        """
+        Build a new engine from the current export files on the engine-load
+        thread; the current one keeps serving until _swap_engine replaces it.
+        """
+        if self.engine is None or self._engine_reloading:
+            return
+        self._engine_reloading = True
+        self._start_engine_load()
+
+    def _swap_engine(self, engine):
+        """
+        Replace the engine with a reloaded one in a single UI-thread step, so
+        nothing is drawn from a mix of old and new data.
+
+        Selected labels the new library no longer has are dropped, expanded
+        fields and groups stay as they are. Per-selection caches are kept for
+        combos whose cached result is still valid under the new export's label
+        fingerprints and dropped otherwise; queries still running on the old
+        engine are discarded and can no longer store their results.
+        """
+        self._engine_reloading = False
+        if engine is None:
+            return  # reload failed (logged); keep the current engine
+        old_engine = self.engine
+        self.query_worker.discard()
+        self._cancel_prefetch()
+        self.engine = engine
+        self.prefetcher.engine = engine
+        self.query_worker.engine = engine
+        # libraries.json is re-read by every load, so the library set may have changed too
+        _, self.fingerprints_path, self.library_dirs = self._cache_sources()
+        self.usage_tracker.load_fingerprints(self.fingerprints_path)  # new generation: old-engine stores are refused
+        if self.usage_tracker.fingerprints is None:
+            self.usage_tracker.clear()  # nothing tells still-valid entries from stale ones
+
+        dropped = self._revalidate_selection()
+        current = {}  # combo key -> its cached result is the same on the new data
+        def is_current(combo_key):
+            if combo_key not in current:
+                current[combo_key] = self.usage_tracker.is_current(combo_key)
+            return current[combo_key]
+        self._refinement_cache = {k: v for k, v in self._refinement_cache.items() if is_current(k)}
+        self._filtered_label_cache = {k: v for k, v in self._filtered_label_cache.items() if is_current(k[1])}
+        self._facet_snapshots = {k: v for k, v in self._facet_snapshots.items() if is_current(k)}
+        if self._last_result is not None and not is_current(self._last_result[0]):
+            self._last_result = None
+        # _page_cache is keyed by the label lists themselves and stays valid
+
+        close = getattr(old_engine, "close", None)
+        if close is not None:
+            close()  # a FederatedEngine's worker processes, a RemoteEngine's daemon connections
+        print(f"🔄 Library reloaded ({len(engine.label_map)} books)")
+        if dropped:
+            print(f"⚠️ No longer in the library, deselected: {', '.join(label for label, _ in dropped)}")
+        if self.in_search_mode:
+            self.perform_search(self.search_query)
         self.update_titles()
 
+    def _revalidate_selection(self):
+        """Deselect labels the current engine doesn't know; returns them."""
+        self._split_cache.clear()
+        known = {}
+        dropped = []
+        for label, field in list(self.selected_labels):
+            if field not in known:
+                labels_info = self.engine.get_labels_for_field(field)
+                names = self.get_split_labels(field, labels_info.get("raw", [])) + labels_info.get("canonical", [])
+                known[field] = {name.strip().lower() for name in names}
+            if label not in known[field]:
+                self.selected_labels.discard((label, field))
+                dropped.append((label, field))
+        if dropped:
+            self.selected_labels_order = [item for item in self.selected_labels_order if item not in dropped]
+        return dropped
+
+    def _end_startup_phase(self, name, started):
+        now = time.perf_counter()
+        self.startup_phases[name] = now - started
+        return now
+
+    def report_startup_profile(self, loop_started):
+        """Print the startup phases and save them to startup_profile.json."""
+        phases = dict(self.startup_phases)
+        first_draw_done = getattr(self.loop.screen, "first_draw_done", None)
+        if first_draw_done is not None:
+            phases["first_render"] = first_draw_done - loop_started
+            phases["time_to_first_frame"] = first_draw_done - STARTUP_T0
+        report = {name: round(seconds * 1000, 1) for name, seconds in phases.items()}
+        print("⏱️ Startup profile (ms):")
+        for name, ms in report.items():
+            print(f"   {name:<20} {ms:>9.1f}")
+        try:
+            with open(os.path.join(SCRIPT_DIR, "startup_profile.json"), "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        except Exception as e:
+            print(f"⚠️ Failed to save startup profile: {e}")
+
+    def mark_dirty(self, *parts):
+        """
+        Record which part of the state changed ("selection", "page", "expansion",
+        "theme") and schedule a single render pass for this loop iteration.
+        """
+        self._dirty.update(parts)
+        if self._render_alarm is None:
+            self._render_alarm = self.loop.set_alarm_in(0, self._render)
+
+    def _render(self, loop=None, user_data=None):
+        self._render_alarm = None
+        dirty, self._dirty = self._dirty, set()
+        if "theme" in dirty:
+            self.loop.screen.clear()
+            self.loop.screen.register_palette(self.themes[self.current_theme])
+        if "selection" in dirty:
+            self.update_selected()
+            self.update_titles()  # rebuilds the label list with the new refinement
+        elif dirty & {"page", "expansion"} and not self.query_worker.pending:
+            # while a query is running the label pane is rebuilt when its result arrives
+            self.build_label_list()
+
+    def _cache_sources(self):
+        """
+        (cache file suffix, fingerprints path(s), export directories) of the
+        library open_engine serves: SCRIPT_DIR itself, or the federation its
+        libraries.json lists. A federation's book ids ("library:book_id") are
+        not a single library's, so every library set gets its own cache file.
+        """
+        from FederatedEngine import read_libraries
+        try:
+            libraries = read_libraries(SCRIPT_DIR)
+        except ValueError as e:
+            logging.error(f"Unreadable libraries.json: {e}")
+            libraries = None
+        if not libraries:
+            return "", os.path.join(SCRIPT_DIR, "label_fingerprints.json"), [SCRIPT_DIR]
+        members = json.dumps(sorted((name, os.path.realpath(path)) for name, path in libraries.items()))
+        suffix = ".federated-" + hashlib.sha1(members.encode("utf-8")).hexdigest()[:12]
+        fingerprints = {name: os.path.join(path, "label_fingerprints.json") for name, path in libraries.items()}
+        return suffix, fingerprints, list(libraries.values())
+
     def _invalidate_stale_cache(self):
         """Check if cache is older than metadata timestamp, and delete if stale."""
-        import time
         cache_path = self.cache_path
-        metadata_timestamp_path = os.path.join(SCRIPT_DIR, "metadata_timestamp.json")
+        fingerprints = self.fingerprints_path
+        if not isinstance(fingerprints, dict):
+            fingerprints = {"": fingerprints}
+        timestamp_paths = [os.path.join(path, "metadata_timestamp.json") for path in self.library_dirs]
         
         # If no cache exists, nothing to invalidate
         if not os.path.exists(cache_path):
             return
         
+        # With label fingerprints (of every library), the tracker drops only
+        # the entries whose postings changed (checked lazily on read)
+        if all(os.path.exists(path) for path in fingerprints.values()):
+            return
+        
         # If no metadata timestamp exists (old setup), keep cache
-        if not os.path.exists(metadata_timestamp_path):
+        timestamp_paths = [path for path in timestamp_paths if os.path.exists(path)]
+        if not timestamp_paths:
             return
         
         try:
-            with open(metadata_timestamp_path, "r", encoding="utf-8") as f:
-                timestamp_data = json.load(f)
-                metadata_time = timestamp_data.get("last_updated", 0)
+            metadata_time = 0
+            for path in timestamp_paths:
+                with open(path, "r", encoding="utf-8") as f:
+                    metadata_time = max(metadata_time, json.load(f).get("last_updated", 0))
             
-            cache_mtime = os.path.getmtime(cache_path)
+            # SQLite writes land in the -wal file until checkpointed
+            cache_files = [p for p in (cache_path, cache_path + "-wal", cache_path + "-shm") if os.path.exists(p)]
+            cache_mtime = max(os.path.getmtime(p) for p in cache_files)
             
             if cache_mtime < metadata_time:
-                os.remove(cache_path)
+                for p in cache_files:
+                    os.remove(p)
                 print(f"🔄 Cache invalidated - metadata is newer, cache will be rebuilt on first query")
         except Exception as e:
             print(f"⚠️ Error checking cache timestamp: {e}")
@@ -218,8 +529,7 @@ class CalibreUI:
             # Clear caches to prevent stale data after undo
             self._refinement_cache.clear()
             self._filtered_label_cache.clear()
-            self.update_selected()
-            self.update_titles()
+            self.mark_dirty("selection")
 
     def strip_suffix(self, label):
         return re.sub(r"-(et|ws|bs|sg|g|p|t|s|pv|pc|rl|rm|pp|a|ct|ns|mv|mg|l)$", "", label)
@@ -227,9 +537,7 @@ class CalibreUI:
     def switch_theme(self, button, theme_name):
         if theme_name in self.themes:
             self.current_theme = theme_name
-            self.loop.screen.clear()
-            self.loop.screen.register_palette(self.themes[theme_name])
-            self.loop.draw_screen()
+            self.mark_dirty("theme")
 
     def build_theme_bar(self):
         self.theme_bar = urwid.Columns([
@@ -256,34 +564,56 @@ class CalibreUI:
         self._page_cache[key] = pages
         return pages
 
-    def get_filtered_labels(self, field, split_labels, refinement):
-        # Build combo_key from (label, field) tuples - format: "label1:field1,label2:field2"
-        label_field_strings = [f"{label}:{fld}" for label, fld in sorted(self.selected_labels)]
-        combo_key = ",".join(label_field_strings)
+    def _current_result(self, combo_key):
+        """Query result for combo_key: the one on screen if it matches, else the combo cache."""
+        if self._last_result is not None and self._last_result[0] == combo_key:
+            return self._last_result[1]
+        return self.usage_tracker.get(combo_key)
+
+    def get_facet_snapshot(self, book_ids=None):
+        """
+        FacetSnapshot of book_ids, or of the current selection's result books
+        (all books when nothing is selected). Selection snapshots are cached.
+        """
+        if book_ids is not None:
+            return self.engine.facet_snapshot(book_ids)
+
+        combo_key = make_combo_key(self.selected_labels)
+        snapshot = self._facet_snapshots.get(combo_key)
+        if snapshot is not None:
+            return snapshot
+
+        if self.selected_labels:
+            result = self._current_result(combo_key)
+            if not result:
+                # Convert tuple set to dict for query: {field: [labels]}
+                labels_by_field_for_query = {}
+                for label, fld in self.selected_labels:
+                    if fld not in labels_by_field_for_query:
+                        labels_by_field_for_query[fld] = []
+                    labels_by_field_for_query[fld].append(label)
+                started = time.perf_counter()
+                result = self.engine.query(labels_by_field_for_query)
+                cost_ms = (time.perf_counter() - started) * 1000
+                self.usage_tracker.store(combo_key, result, cost_ms=cost_ms)
+            book_ids = result.get("books", {}).keys()
+        else:
+            book_ids = None  # all books
+
+        snapshot = self.engine.facet_snapshot(book_ids)
+        if len(self._facet_snapshots) >= FACET_SNAPSHOT_CACHE_SIZE:
+            del self._facet_snapshots[next(iter(self._facet_snapshots))]  # oldest first
+        self._facet_snapshots[combo_key] = snapshot
+        return snapshot
+
+    def get_filtered_labels(self, field, split_labels, snapshot):
+        combo_key = make_combo_key(self.selected_labels)
         cache_key = (field, combo_key)
         if cache_key in self._filtered_label_cache:
             return self._filtered_label_cache[cache_key]
 
-        # Pass field-aware labels to query
-        result = self.usage_tracker.get(combo_key)
-        if not result:
-            # Convert tuple set to dict for query: {field: [labels]}
-            labels_by_field_for_query = {}
-            for label, fld in self.selected_labels:
-                if fld not in labels_by_field_for_query:
-                    labels_by_field_for_query[fld] = []
-                labels_by_field_for_query[fld].append(label)
-            result = self.engine.query(labels_by_field_for_query)
-            self.usage_tracker.store(combo_key, result)
-
-        books = result.get("books", {})
-        label_set = set()
-
-        for book_id in books:
-            book_info = self.engine.label_map.get(book_id, {})
-            labels_by_field = book_info.get("labels_by_field", {})
-            for lbl in labels_by_field.get(field, []):
-                label_set.add(lbl.strip().lower())
+        # Labels present in the books matching the current selection
+        label_set = snapshot.labels(field)
 
         filtered = []
         for label in sorted(split_labels):
@@ -301,122 +631,44 @@ class CalibreUI:
         self._filtered_label_cache[cache_key] = filtered
         return filtered
 
-    def compute_label_counts(self, field, refinement, filtered_book_ids=None):
-        """
-        Produce a mapping of label (lowercase) -> count.
-
-        Strategy:
-        - If refinement contains explicit counts for this field, use them as base.
-        - Otherwise, fall back to scanning filtered books and counting:
-            - If an item belongs to a series, count that series as 1 for the label (regardless of how many volumes).
-            - If an item does NOT belong to a series, count it per book id.
-        - When labels are selected (filtered_book_ids provided), count labels across ALL fields,
-          not just the specific field, to match query behavior.
-        
-        Args:
-            field: The label field to count
-            refinement: Cached refinement counts from query
-            filtered_book_ids: Set of book IDs to count from (only books matching current selections)
+    def build_label_list(self, refinement=None, filtered_book_ids=None):
         """
-        counts = {}
-
-        # Start from refinement counts if available
-        if refinement and field in refinement:
-            try:
-                for lbl, cnt in refinement.get(field, []):
-                    counts[lbl.lower()] = int(cnt)
-            except Exception:
-                pass  # defensive
-
-        # If engine or label_map missing, return whatever we have
-        if not self.engine or not hasattr(self.engine, "label_map"):
-            return counts
-
-        per_label_series = {}  # key -> set of series names (lower)
-        per_label_books = {}   # key -> set of book ids (standalone)
-
-        # Only iterate over filtered books if provided, otherwise use all books
-        if filtered_book_ids is not None:
-            items_to_iterate = filtered_book_ids
-        else:
-            items_to_iterate = self.engine.label_map.keys()
-
-        for book_id in items_to_iterate:
-            info = self.engine.label_map.get(book_id)
-            if not info:
-                continue
-            labels_by_field = info.get("labels_by_field", {})
-            
-            # Count labels ONLY from the specified field (not all fields)
-            label_values = labels_by_field.get(field, []) if field else []
-            
-            if not label_values:
-                continue
-
-            # determine series name if present
-            series_name = ""
-            for k in ('series', 'series_name', 'series_title'):
-                s = info.get(k)
-                if s:
-                    series_name = str(s).strip().lower()
-                    break
-
-            # Skip "standalone novels" - treat these as standalone books, not series
-            if series_name == "standalone novels":
-                series_name = ""
-
-            for raw_lbl in label_values:
-                key = raw_lbl.strip().lower()
-                if not key:
-                    continue
-                if series_name:
-                    per_label_series.setdefault(key, set()).add(series_name)
-                else:
-                    per_label_books.setdefault(key, set()).add(book_id)
+        Normal category/label list, unless in search mode.
 
-        # Merge results: refinement counts stay if present, otherwise use computed counts.
-        all_keys = set(counts.keys()) | set(per_label_series.keys()) | set(per_label_books.keys())
-        for key in all_keys:
-            if key in counts:
-                continue
-            series_set = per_label_series.get(key, set())
-            book_set = per_label_books.get(key, set())
-            # count series as single entries (1 per unique series)
-            counts[key] = len(series_set) + len(book_set)
-
-        return counts
-
-    def build_label_list(self, restore_focus_position=None, refinement=None, filtered_book_ids=None):
-        """Normal category/label list, unless in search mode."""
+        Counts come from filtered_book_ids when given (e.g. the books of an
+        expanded group), otherwise from the current selection's facet snapshot.
+        """
         if self.in_search_mode:
             # Don't build the normal list if in search mode
             return
         self._split_cache.clear()
-        walker = self.label_listbox.body
-        walker.clear()
+        self._prefetch_candidates = []
+        rows = []
 
         if not self.engine:
-            walker.append(urwid.Text("❌ Engine not initialized."))
+            if self.engine_loading:
+                rows = [{"kind": "message", "text": "⏳ Loading library…"}]
+                rows += [{"kind": "message", "field": field, "text": f"▶ {field}"} for field in self._early_fields]
+                self.label_walker.set_rows(rows)
+            else:
+                self.label_walker.set_rows([{"kind": "message", "text": "❌ Engine not initialized."}])
             return
 
         all_fields = sorted(self.engine.dynamic_vocab.keys())
 
         if refinement is None:
             if self.selected_labels:
-                label_field_strings = [f"{label}:{fld}" for label, fld in sorted(self.selected_labels)]
-                combo_key = ",".join(label_field_strings)
+                combo_key = make_combo_key(self.selected_labels)
                 refinement = self._refinement_cache.get(combo_key, {})
             else:
                 refinement = {}
 
-        # Get filtered book IDs from cached query result or use provided parameter
+        # One pass over the matching books gives every field's labels and counts
+        selection_snapshot = self.get_facet_snapshot()
         if filtered_book_ids is None:
-            if self.selected_labels:
-                label_field_strings = [f"{label}:{fld}" for label, fld in sorted(self.selected_labels)]
-                combo_key = ",".join(label_field_strings)
-                cached = self.usage_tracker.get(combo_key)
-                if cached:
-                    filtered_book_ids = set(cached.get("books", {}).keys())
+            count_snapshot = selection_snapshot
+        else:
+            count_snapshot = self.get_facet_snapshot(filtered_book_ids)
         
         # Keep alphabetical order - don't reorder fields
         
@@ -425,7 +677,6 @@ class CalibreUI:
         
         for field in all_fields:
             is_expanded = self.expanded_categories.get(field, False)
-            toggle = "▼" if is_expanded else "▶"
             
             # Pre-compute label counts for ALL fields (not just expanded)
             # This is needed to grey-out fields with 0 combinations BEFORE clicking
@@ -438,22 +689,14 @@ class CalibreUI:
             for group_data in groups.values():
                 for member in group_data.get("members", []):
                     group_member_set.add(member.lower())
-            temp_filtered_labels = self.get_filtered_labels(field, split_labels, temp_refinement)
+            temp_filtered_labels = self.get_filtered_labels(field, split_labels, selection_snapshot)
             temp_filtered_labels = [l for l in temp_filtered_labels if l.lower() not in group_member_set]
-            temp_label_counts = self.compute_label_counts(field, temp_refinement, filtered_book_ids)
+            temp_label_counts = count_snapshot.counts(field, temp_refinement)
             total_field_count = sum(temp_label_counts.values())
             
             # Grey out field if has selections and 0 combinations
             should_grey_out = has_selections and total_field_count == 0
-            
-            if should_grey_out:
-                # Grey out - show as disabled, non-clickable
-                header_btn = urwid.Text(f"  {toggle} {field} (0)")
-                walker.append(urwid.AttrMap(header_btn, 'greyed_out'))
-            else:
-                header_btn = urwid.Button(f"{toggle} {field}")
-                urwid.connect_signal(header_btn, 'click', self.toggle_category, user_arg=field)
-                walker.append(urwid.AttrMap(header_btn, 'header'))
+            rows.append({"kind": "field", "field": field, "expanded": is_expanded, "greyed": should_grey_out})
 
             if not is_expanded:
                 continue
@@ -493,58 +736,38 @@ class CalibreUI:
                 group_key = (field, group_name)
                 is_group_expanded = group_key in self.expanded_groups
 
-                group_toggle = "▼" if is_group_expanded else "📂"
                 total_count = sum(label_counts.get(m.lower(), 0) for m in members)
                 
                 # Skip groups with no matching books
                 if total_count == 0:
                     continue
                 
-                group_text = f"  {group_toggle} {group_name} ({total_count})"
-
-                group_btn = urwid.Button(group_text)
-                def make_toggle_handler(f, gname):
-                    return lambda btn: self.toggle_group_expand(btn, f, gname)
-                urwid.connect_signal(group_btn, 'click', make_toggle_handler(field, group_name))
-                walker.append(urwid.AttrMap(group_btn, 'header', focus_map='reversed'))
+                rows.append({"kind": "group", "field": field, "group": group_name,
+                             "count": total_count, "expanded": is_group_expanded})
 
                 if is_group_expanded:
                     for member in members:
                         member_key = member.lower()
-                        is_selected = (member_key, field) in self.selected_labels
                         count = label_counts.get(member_key, 0)
                         
                         # Skip labels with 0 count (don't show them at all)
                         if count == 0:
                             continue
                         
-                        count_str = f" ({count})"
-                        member_text = f"    • {member}{count_str}"
-                        mbtn = urwid.Button(member_text)
-                        mbtn._category = field
-                        urwid.connect_signal(mbtn, 'click', self.toggle_label, user_arg=(member_key, field))
-                        mstyle = 'selected' if is_selected else 'raw'
-                        walker.append(urwid.AttrMap(mbtn, mstyle, focus_map='reversed'))
+                        rows.append({"kind": "member", "field": field, "group": group_name, "label": member,
+                                     "key": member_key, "count": count,
+                                     "selected": (member_key, field) in self.selected_labels})
+                        self._prefetch_candidates.append((member_key, field, count))
             
             # Render groups pagination BELOW the groups
             if group_list:
-                group_nav = []
-                if group_page_index > 0:
-                    prev_btn = urwid.Button("← Prev", on_press=self.prev_group_page, user_data=(group_page_key, field))
-                    group_nav.append(urwid.AttrMap(prev_btn, 'header', focus_map='reversed'))
-                
-                group_nav.append(urwid.Text(f"Groups: {group_page_index + 1}/{len(group_pages)}"))
-                
-                if group_page_index < len(group_pages) - 1:
-                    next_btn = urwid.Button("Next →", on_press=self.next_group_page, user_data=(group_page_key, field))
-                    group_nav.append(urwid.AttrMap(next_btn, 'header', focus_map='reversed'))
-                
-                walker.append(urwid.Columns(group_nav))
+                rows.append({"kind": "group_nav", "field": field, "page_key": group_page_key,
+                             "page": group_page_index, "pages": len(group_pages)})
             
             # Label pagination (15 per page)
             if not filtered_labels:
-                walker.append(urwid.Text("⚠️ No labels to display in this category."))
-                walker.append(urwid.Divider())
+                rows.append({"kind": "message", "field": field, "text": "⚠️ No labels to display in this category."})
+                rows.append({"kind": "divider", "field": field})
                 continue
 
             pages = []
@@ -558,95 +781,194 @@ class CalibreUI:
 
             for label in current_page:
                 key = label.lower()
-                is_selected = (key, field) in self.selected_labels
                 count = label_counts.get(key, 0)
-                count_str = f" ({count})" if count > 0 else ""
-                label_text = f"  • {label}{count_str}"
-                btn = urwid.Button(label_text)
-                btn._category = field
-                urwid.connect_signal(btn, 'click', self.toggle_label, user_arg=(key, field))
-                style = 'selected' if is_selected else 'raw'
-                walker.append(urwid.AttrMap(btn, style, focus_map='reversed'))
+                rows.append({"kind": "label", "field": field, "label": label, "key": key, "count": count,
+                             "selected": (key, field) in self.selected_labels})
+                self._prefetch_candidates.append((key, field, count))
             
             # Render labels pagination BELOW the labels
-            label_nav = []
-            if page_index > 0:
-                prev_btn = urwid.Button("← Prev", on_press=self.prev_category_page, user_data=field)
-                label_nav.append(urwid.AttrMap(prev_btn, 'header', focus_map='reversed'))
-            
-            label_nav.append(urwid.Text(f"Labels: {page_index + 1}/{len(pages)}"))
-            
-            if page_index < len(pages) - 1:
-                next_btn = urwid.Button("Next →", on_press=self.next_category_page, user_data=field)
-                label_nav.append(urwid.AttrMap(next_btn, 'header', focus_map='reversed'))
-            
-            walker.append(urwid.Columns(label_nav))
+            rows.append({"kind": "label_nav", "field": field, "page": page_index, "pages": len(pages)})
+            rows.append({"kind": "divider", "field": field})
+
+        # Diff against the current rows: counts/styles are patched in place and the
+        # focus stays on the same row even when rows above it appear or vanish
+        self.label_walker.update_rows(rows)
 
-            walker.append(urwid.Divider())
+        self._schedule_prefetch()
 
-        if restore_focus_position is not None:
-            try:
-                self.label_listbox.focus_position = restore_focus_position
-            except IndexError:
-                pass
+    def _make_label_row_widget(self, row):
+        """Build the urwid widget for one row of the label pane (called on demand by LabelListWalker)."""
+        kind = row["kind"]
+        field = row.get("field")
+
+        if kind == "field":
+            if row["greyed"]:
+                # Grey out - show as disabled, non-clickable
+                return urwid.AttrMap(urwid.Text(self._label_row_caption(row)), 'greyed_out')
+            header_btn = urwid.Button(self._label_row_caption(row))
+            urwid.connect_signal(header_btn, 'click', self.toggle_category, user_arg=field)
+            return urwid.AttrMap(header_btn, 'header')
+
+        if kind == "group":
+            group_btn = urwid.Button(self._label_row_caption(row))
+            def make_toggle_handler(f, gname):
+                return lambda btn: self.toggle_group_expand(btn, f, gname)
+            urwid.connect_signal(group_btn, 'click', make_toggle_handler(field, row["group"]))
+            return urwid.AttrMap(group_btn, 'header', focus_map='reversed')
+
+        if kind in ("member", "label"):
+            btn = urwid.Button(self._label_row_caption(row))
+            btn._category = field
+            urwid.connect_signal(btn, 'click', self.toggle_label, user_arg=(row["key"], field))
+            style = 'selected' if row["selected"] else 'raw'
+            return urwid.AttrMap(btn, style, focus_map='reversed')
+
+        if kind in ("group_nav", "label_nav"):
+            if kind == "group_nav":
+                prev_handler, next_handler = self.prev_group_page, self.next_group_page
+                user_data = (row["page_key"], field)
+                caption = "Groups"
+            else:
+                prev_handler, next_handler = self.prev_category_page, self.next_category_page
+                user_data = field
+                caption = "Labels"
+            nav = []
+            if row["page"] > 0:
+                prev_btn = urwid.Button("← Prev", on_press=prev_handler, user_data=user_data)
+                nav.append(urwid.AttrMap(prev_btn, 'header', focus_map='reversed'))
+            nav.append(urwid.Text(f"{caption}: {row['page'] + 1}/{row['pages']}"))
+            if row["page"] < row["pages"] - 1:
+                next_btn = urwid.Button("Next →", on_press=next_handler, user_data=user_data)
+                nav.append(urwid.AttrMap(next_btn, 'header', focus_map='reversed'))
+            return urwid.Columns(nav)
+
+        if kind == "search_result":
+            btn = urwid.Button(f"• {row['label']} ({field})")
+            urwid.connect_signal(btn, 'click', self.select_from_search, user_arg=(row["label"].lower(), field))
+            return urwid.AttrMap(btn, 'raw', focus_map='reversed')
+
+        if kind == "divider":
+            return urwid.Divider()
+
+        return urwid.Text(row.get("text", ""))
+
+    def _label_row_caption(self, row):
+        kind = row["kind"]
+        if kind == "field":
+            toggle = "▼" if row["expanded"] else "▶"
+            return f"  {toggle} {row['field']} (0)" if row["greyed"] else f"{toggle} {row['field']}"
+        if kind == "group":
+            group_toggle = "▼" if row["expanded"] else "📂"
+            return f"  {group_toggle} {row['group']} ({row['count']})"
+        count = row["count"]
+        count_str = f" ({count})" if count > 0 else ""
+        indent = "    " if kind == "member" else "  "
+        return f"{indent}• {row['label']}{count_str}"
+
+    def _update_label_row_widget(self, widget, old_row, new_row):
+        """Patch a row widget in place for count/style/toggle changes. False = rebuild it."""
+        kind = new_row["kind"]
+        if kind == "field":
+            if old_row["greyed"] or new_row["greyed"]:
+                return False
+            widget.base_widget.set_label(self._label_row_caption(new_row))
+            return True
+        if kind == "group":
+            widget.base_widget.set_label(self._label_row_caption(new_row))
+            return True
+        if kind in ("member", "label"):
+            widget.base_widget.set_label(self._label_row_caption(new_row))
+            widget.set_attr_map({None: 'selected' if new_row["selected"] else 'raw'})
+            return True
+        return False
+
+    def _schedule_prefetch(self):
+        """(Re)start the idle timer after which the cache warmer runs."""
+        self._cancel_prefetch()
+        if self.engine and self._prefetch_candidates:
+            self._prefetch_alarm = self.loop.set_alarm_in(PREFETCH_IDLE_DELAY, self._start_prefetch)
+
+    def _start_prefetch(self, loop, user_data):
+        self._prefetch_alarm = None
+        self.prefetcher.start(self.selected_labels, self._prefetch_candidates)
+
+    def _cancel_prefetch(self):
+        if self._prefetch_alarm is not None:
+            self.loop.remove_alarm(self._prefetch_alarm)
+            self._prefetch_alarm = None
+        self.prefetcher.cancel()
+
+    def _filter_input(self, keys, raw):
+        """
+        Any user action cancels the cache warmer so it never competes with a click,
+        and wakes the animation and clock if they went idle.
+        """
+        if keys:
+            self._cancel_prefetch()
+            self._last_input = time.monotonic()
+            if self._animation_alarm is None:
+                self._animation_alarm = self.loop.set_alarm_in(0.1, self.animate_book)
+            if self._clock_idle:
+                self.loop.remove_alarm(self._clock_alarm)
+                self.update_clock(None, None)
+        return keys
+
+    def is_idle(self):
+        return time.monotonic() - self._last_input >= IDLE_TIMEOUT
+
+    def activity_stats(self):
+        """Timer wakeups, redraws and terminal output of this session, in total and per minute."""
+        minutes = max((time.monotonic() - self._started) / 60, 1 / 60)
+        screen = self.loop.screen
+        stats = {
+            "minutes": round(minutes, 2),
+            "wakeups": self.wakeups,
+            "wakeups_per_minute": round(self.wakeups / minutes, 1),
+        }
+        if isinstance(screen, MeteredScreen):
+            stats.update({
+                "redraws": screen.redraws,
+                "redraws_per_minute": round(screen.redraws / minutes, 1),
+                "bytes_written": screen.bytes_written,
+                "bytes_per_minute": round(screen.bytes_written / minutes, 1),
+            })
+        return stats
 
     def toggle_category(self, button, field):
         self.expanded_categories[field] = not self.expanded_categories.get(field, False)
         if self.expanded_categories[field]:
             self.last_active_category = field
-            # Save current focus position before rebuilding
-            focus_position = self.label_listbox.focus_position
-            self.build_label_list(restore_focus_position=focus_position)
+            self.mark_dirty("expansion")
         else:
             self.remove_category_widgets(field)
 
     def remove_category_widgets(self, field):
-        walker = self.label_listbox.body
-        new_body = []
-        skip = False
-        for widget in walker:
-            base = widget.base_widget if isinstance(widget, urwid.AttrMap) else widget
-            if isinstance(base, urwid.Button) and base.get_label().startswith(("▼", "▶")):
-                label = base.get_label()
-                match = re.match(r"[▶▼] (.+)", label)
-                if match and match.group(1) == field:
-                    skip = True
-                    new_body.append(widget)
-                    continue
-            if skip:
-                if isinstance(base, urwid.Divider):
-                    skip = False
+        new_rows = []
+        for row in self.label_walker.rows:
+            if row.get("field") == field and row["kind"] != "field":
                 continue
-            new_body.append(widget)
-        self.label_listbox.body[:] = new_body
+            if row["kind"] == "field" and row["field"] == field:
+                row = dict(row, expanded=False)
+            new_rows.append(row)
+        self.label_walker.update_rows(new_rows)
 
     def get_focused_category(self):
-        focus_widget = self.label_listbox.focus
-        if not focus_widget:
-            return self.last_active_category
-        base = focus_widget.base_widget
-        if hasattr(base, '_category'):
-            return base._category
-        if isinstance(base, urwid.Button):
-            label = base.get_label()
-            match = re.match(r"[▶▼] (.+)", label)
-            if match:
-                return match.group(1)
+        row = self.label_walker.focus_row
+        if row and row.get("field"):
+            return row["field"]
         return self.last_active_category
 
     def next_category_page(self, button=None, field=None):
         field = field or self.last_active_category
         if field:
             self.category_page_index[field] = self.category_page_index.get(field, 0) + 1
-            focus_position = self.label_listbox.focus_position
-            self.build_label_list(restore_focus_position=focus_position)
+            self.mark_dirty("page")
 
     def prev_category_page(self, button=None, field=None):
         field = field or self.last_active_category
         if field:
             self.category_page_index[field] = max(0, self.category_page_index.get(field, 0) - 1)
-            focus_position = self.label_listbox.focus_position
-            self.build_label_list(restore_focus_position=focus_position)
+            self.mark_dirty("page")
 
     def prev_group_page(self, button=None, data=None):
         if data:
@@ -654,8 +976,7 @@ class CalibreUI:
             key = group_page_key.replace('-', '_')
             current = getattr(self, f'group_page_index_{key}', 0)
             setattr(self, f'group_page_index_{key}', max(0, current - 1))
-            focus_position = self.label_listbox.focus_position
-            self.build_label_list(restore_focus_position=focus_position)
+            self.mark_dirty("page")
 
     def next_group_page(self, button=None, data=None):
         if data:
@@ -663,8 +984,7 @@ class CalibreUI:
             key = group_page_key.replace('-', '_')
             current = getattr(self, f'group_page_index_{key}', 0)
             setattr(self, f'group_page_index_{key}', current + 1)
-            focus_position = self.label_listbox.focus_position
-            self.build_label_list(restore_focus_position=focus_position)
+            self.mark_dirty("page")
 
     def toggle_label(self, button, label_or_tuple):
         # Handle tuple from user_arg - urwid passes tuple as single arg
@@ -684,14 +1004,7 @@ class CalibreUI:
             if label_field_tuple not in self.selected_labels_order:
                 self.selected_labels_order.append(label_field_tuple)
         
-        # Save focus position to restore after rebuilding UI
-        try:
-            focus_position = self.label_listbox.focus_position
-        except (IndexError, AttributeError):
-            focus_position = None
-        
-        self.update_selected()
-        self.update_titles(restore_focus_position=focus_position)
+        self.mark_dirty("selection")
 
     def select_from_search(self, button, label_or_tuple):
         """When user selects a label from search, add it and restore normal UI."""
@@ -708,16 +1021,16 @@ class CalibreUI:
         if label_field_tuple not in self.selected_labels_order:
             self.selected_labels_order.append(label_field_tuple)
         self.in_search_mode = False  # <--- Restore normal list
-        self.update_selected()
-        self.update_titles()
-        self.build_label_list()
+        self.mark_dirty("selection")
 
     def perform_search(self, query):
         """Show search results for labels matching query, from all categories."""
         self.in_search_mode = True
         self.search_query = query
         if not self.engine:
-            self.label_listbox.body[:] = [urwid.Text("❌ Engine not initialized.")]
+            # a search typed while loading is re-run by _on_engine_loaded
+            text = "⏳ Loading library…" if self.engine_loading else "❌ Engine not initialized."
+            self.label_walker.set_rows([{"kind": "message", "text": text}])
             return
 
         all_fields = sorted(self.engine.dynamic_vocab.keys())
@@ -729,14 +1042,12 @@ class CalibreUI:
                     all_label_results.append((label, field))
 
         if all_label_results:
-            self.label_listbox.body[:] = [urwid.Text(f"🔍 Results for '{query}':")]
+            rows = [{"kind": "message", "text": f"🔍 Results for '{query}':"}]
             for label, field in all_label_results:
-                label_text = f"• {label} ({field})"
-                btn = urwid.Button(label_text)
-                urwid.connect_signal(btn, 'click', self.select_from_search, user_arg=(label.lower(), field))
-                self.label_listbox.body.append(urwid.AttrMap(btn, 'raw', focus_map='reversed'))
+                rows.append({"kind": "search_result", "field": field, "label": label})
         else:
-            self.label_listbox.body[:] = [urwid.Text(f"🔍 No results for '{query}'.")]
+            rows = [{"kind": "message", "text": f"🔍 No results for '{query}'."}]
+        self.label_walker.set_rows(rows)
 
     def paginate_labels(self, labels, page_size):
         for i in range(0, len(labels), page_size):
@@ -746,42 +1057,64 @@ class CalibreUI:
         for i in range(0, len(entries), page_size):
             yield entries[i:i + page_size]
 
-    def update_titles(self, restore_focus_position=None):
-        walker = self.title_listbox.body
-        walker.clear()
-
-        # reset series map for this query
-        self.last_query_series_map = {}
+    def update_titles(self):
+        # any query still running belongs to a previous selection
+        self.query_worker.discard()
 
         if not self.selected_labels or not self.engine:
-            walker.append(urwid.Text("📘 Select a label to view matching titles."))
-            self.build_label_list(restore_focus_position=restore_focus_position)
+            walker = self.title_listbox.body
+            walker.clear()
+            self.last_query_series_map = {}
+            if self.engine_loading:
+                walker.append(urwid.Text("⏳ Loading library…"))
+            else:
+                walker.append(urwid.Text("📘 Select a label to view matching titles."))
+            self.build_label_list()
             return
 
-        # Build combo_key with field info: "label1:field1,label2:field2"
-        label_field_strings = [f"{label}:{fld}" for label, fld in sorted(self.selected_labels)]
-        combo_key = ",".join(label_field_strings)
+        combo_key = make_combo_key(self.selected_labels)
         cached = self.usage_tracker.get(combo_key)
 
         if cached:
             print(f"🧠 Cache hit for {combo_key}")
-            result = cached
-        else:
-            print(f"🔄 Live query for {combo_key}")
-            # Convert tuple set to dict for query: {field: [labels]}
-            labels_by_field_for_query = {}
-            for label, fld in self.selected_labels:
-                if fld not in labels_by_field_for_query:
-                    labels_by_field_for_query[fld] = []
-                labels_by_field_for_query[fld].append(label)
-            result = self.engine.query(labels_by_field_for_query)
-            self.usage_tracker.store(combo_key, result)
+            self._show_query_result(combo_key, cached)
+            return
+
+        print(f"🔄 Live query for {combo_key}")
+        # Convert tuple set to dict for query: {field: [labels]}
+        labels_by_field_for_query = {}
+        for label, fld in self.selected_labels:
+            if fld not in labels_by_field_for_query:
+                labels_by_field_for_query[fld] = []
+            labels_by_field_for_query[fld].append(label)
+        self._cancel_prefetch()  # don't compete with the query the user is waiting for
+        self.query_worker.submit(combo_key, labels_by_field_for_query)
+
+        # Keep the label pane as it is until the result arrives; only show progress
+        walker = self.title_listbox.body
+        walker.clear()
+        self.last_query_series_map = {}
+        walker.append(urwid.Text("⏳ Computing matching titles…"))
+
+    def _show_query_result(self, combo_key, result):
+        """Fill the Titles pane (and refresh the label pane) from a query result."""
+        walker = self.title_listbox.body
+        walker.clear()
+
+        # reset series map for this query
+        self.last_query_series_map = {}
+
+        if result is None:
+            walker.append(urwid.Text("❌ Query failed."))
+            return
+        self._last_result = (combo_key, result)
 
         refinement = result.get("refinable_labels", {})
         self._refinement_cache[combo_key] = refinement
-        self.build_label_list(refinement=refinement, restore_focus_position=restore_focus_position)
+        self.build_label_list(refinement=refinement)
 
         books = result.get("books", {})
+        self.engine.preload_books(books)
         seen_series = set()
 
         # Build mapping series -> volumes (only from current result/books)
@@ -828,14 +1161,14 @@ class CalibreUI:
                     continue
                 seen_series.add(norm_series)
                 display_title = title or (self.last_query_series_map.get(norm_series, [{}])[0].get("title", "") or book_id)
-                btn_label = f"📗 {display_title} (Series: {raw_series}) — Author: {author}"
+                btn_label = f"📗 {display_title} (Series: {raw_series}) — Author: {author}{library_tag(data)}"
                 btn = urwid.Button(btn_label)
                 urwid.connect_signal(btn, 'click', self.open_series_popup, user_arg=norm_series)
                 walker.append(urwid.AttrMap(btn, 'title', focus_map='reversed'))
             else:
                 # standalone book -> clickable to show description/info
                 display_title = title or book_id.split(":")[-1].strip()
-                btn_label = f"📘 {display_title} — Author: {author}"
+                btn_label = f"📘 {display_title} — Author: {author}{library_tag(data)}"
                 btn = urwid.Button(btn_label)
                 # create the volume dict for this standalone and pass to open_volume_info
                 volume = self.last_query_series_map.get(book_id, [{}])[0]
@@ -969,18 +1302,33 @@ class CalibreUI:
         return itertools.cycle(frames)
 
     def animate_book(self, loop, user_data):
+        self.wakeups += 1
         self.rotating_book_widget.set_text(next(self.frame_gen))
-        loop.set_alarm_in(0.1, self.animate_book)
+        if self.is_idle():
+            self._animation_alarm = None  # restarted by _filter_input on the next input
+            return
+        self._animation_alarm = loop.set_alarm_in(0.1, self.animate_book)
 
     def update_clock(self, loop, user_data):
         """
-        Update the digital clock every second.
+        Update the digital clock every second, or once a minute (without seconds) while idle.
+
+        Only the clock's text changes, so urwid re-renders just that widget and
+        the terminal only receives the footer row.
         """
+        self.wakeups += 1
         now = datetime.now()
-        self.clock_widget.set_text(now.strftime("%Y-%m-%d %H:%M:%S"))
+        self._clock_idle = self.is_idle()
+        self._check_library()
+        if self._clock_idle:
+            self.clock_widget.set_text(now.strftime("%Y-%m-%d %H:%M"))
+            delay = 60 - now.second - now.microsecond / 1e6
+        else:
+            self.clock_widget.set_text(now.strftime("%Y-%m-%d %H:%M:%S"))
+            delay = 1
         # re-schedule
         try:
-            self.loop.set_alarm_in(1, self.update_clock)
+            self._clock_alarm = self.loop.set_alarm_in(delay, self.update_clock)
         except Exception:
             # in case loop is not yet available or shutting down
             pass
@@ -996,50 +1344,33 @@ class CalibreUI:
             self._refinement_cache.clear()
             self._filtered_label_cache.clear()
             self._page_cache.clear()
-            self.update_selected()
-            self.update_titles()
-            self.build_label_list()
+            self.mark_dirty("selection")
         elif key in ('t', 'T'):
             self.toggle_feeds(None)
         elif key in ('g', 'G'):
             self.open_group_dialog()
         elif key in ('u', 'U'):
             self.undo_last_label(None)
+        elif key in ('r', 'R'):
+            self.reload_engine()
         elif key == 'enter':
             if self.in_search_mode:
                 return
-            focus_widget = self.label_listbox.focus
-            focus_position = self.label_listbox.focus_position
-            base = focus_widget.base_widget
-            if isinstance(base, urwid.Button):
-                label = base.get_label()
-                match = re.match(r"[▶▼] (.+)", label)
-                if match:
-                    field = match.group(1)
-                    self.toggle_category(None, field)
-                    self.build_label_list(restore_focus_position=focus_position)
-                    return
-            if hasattr(base, '_category'):
-                label_text = base.get_label()
-                label_clean = label_text.strip().lstrip("•").split("(", 1)[0].strip().lower()
-                field = base._category
-                self.toggle_label(None, label_clean, field)
-                # Don't rebuild label list - toggle_label already updates the UI
+            row = self.label_walker.focus_row
+            if not row:
+                return
+            if row["kind"] == "field" and not row["greyed"]:
+                self.toggle_category(None, row["field"])
+                return
+            if row["kind"] in ("label", "member"):
+                self.toggle_label(None, (row["key"], row["field"]))
         elif key in ('-', '+'):
             field = self.get_focused_category()
             if field:
-                focus_position = self.label_listbox.focus_position
-                # Simpler approach: determine which pagination to use based on field
-                # Check if there's a current page index for this field
-                current_page = self.category_page_index.get(field, 0)
-                
                 if key == '+':
                     self.next_category_page(field=field)
                 else:
                     self.prev_category_page(field=field)
-                
-                # Rebuild and restore focus
-                self.build_label_list(restore_focus_position=focus_position)
 
     def update_selected(self):
         if self.selected_labels:
@@ -1179,7 +1510,7 @@ class CalibreUI:
 
             self.engine.save_label_groups()
             self.expanded_groups = {}
-            self.build_label_list()
+            self.mark_dirty("expansion")
             self._back_to_fields(None)
 
         create_btn = urwid.Button("✓ Create Group")
@@ -1355,7 +1686,7 @@ class CalibreUI:
                     del self.engine.label_groups[field][group_name]
                     self.engine.save_label_groups()
                     self.expanded_groups = {}
-                    self.build_label_list()
+                    self.mark_dirty("expansion")
             # Refresh the dialog
             self._build_group_labels_view()
             self.loop.draw_screen()
@@ -1543,7 +1874,7 @@ class CalibreUI:
                     self.engine.label_groups[field][new_name] = group_data
                     self.engine.save_label_groups()
                     self.expanded_groups = {}
-                    self.build_label_list()
+                    self.mark_dirty("expansion")
             
             self._build_group_labels_view()
             self.loop.draw_screen()
@@ -1598,8 +1929,7 @@ class CalibreUI:
         if key in self.expanded_groups and not has_member_selected:
             self._build_titles_with_group(field, group_name, members)
         else:
-            # Don't rebuild label list - just update titles to preserve focus
-            self.update_titles()
+            self.mark_dirty("selection")
 
     def _get_books_for_labels(self, labels_by_field):
         """Get book IDs matching any labels in the dict using inverted index. O(1) lookup."""
@@ -1624,6 +1954,7 @@ class CalibreUI:
 
     def _build_titles_with_group(self, field, group_name, members):
         """Build titles showing books from ALL group members (OR logic)."""
+        self.query_worker.discard()
         walker = self.title_listbox.body
         walker.clear()
         self.last_query_series_map = {}
@@ -1648,7 +1979,7 @@ class CalibreUI:
             other_labels_by_field[fld].append(label)
         
         # Check cache for this group first
-        group_cache_key = f"GROUP:{field}:{group_name}"
+        group_cache_key = make_group_key(field, group_name)
         cached_group_books = self.usage_tracker.get(group_cache_key)
         
         if cached_group_books:
@@ -1676,15 +2007,18 @@ class CalibreUI:
             
             # Store in cache for next time
             cache_result = {"books": {bid: {"labels": set()} for bid in all_group_books}}
-            self.usage_tracker.store(group_cache_key, cache_result)
+            self.usage_tracker.store(group_cache_key, cache_result,
+                                     depends_on=[(field, m.lower()) for m in members])
         
         # Get the books data
+        self.engine.preload_books(all_group_books)
         books = {}
         for book_id in all_group_books:
             info = self.engine.label_map.get(book_id, {})
             data = {
                 "series": info.get("series", ""),
-                "author": info.get("author", "Unknown")
+                "author": info.get("author", "Unknown"),
+                "library": info.get("library")
             }
             books[book_id] = data
         
@@ -1726,7 +2060,7 @@ class CalibreUI:
         for volume_entry in standalone_entries:
             display_title = volume_entry.get("title", "")
             author = volume_entry.get("author", "Unknown")
-            btn_label = f"📘 {display_title} — Author: {author}"
+            btn_label = f"📘 {display_title} — Author: {author}{library_tag(volume_entry.get('data'))}"
             btn = urwid.Button(btn_label)
             btn._book_data = volume_entry
             book_id = volume_entry.get("book_id")
@@ -1739,7 +2073,7 @@ class CalibreUI:
             raw_series = (first_volume.get("data", {}).get("series") or "").strip()
             display_title = first_volume.get("title", norm_series)
             author = first_volume.get("author", "Unknown")
-            btn_label = f"📗 {display_title} (Series: {raw_series}) — Author: {author}"
+            btn_label = f"📗 {display_title} (Series: {raw_series}) — Author: {author}{library_tag(first_volume.get('data'))}"
             btn = urwid.Button(btn_label)
             urwid.connect_signal(btn, 'click', self.open_series_popup, user_arg=norm_series)
             walker.append(urwid.AttrMap(btn, 'title', focus_map='reversed'))
@@ -1751,17 +2085,33 @@ class CalibreUI:
 
     def refresh_suggestions(self):
         if self.feeds_enabled:
-            rss_items = self.fetch_rss_suggestions([
-                "https://www.theguardian.com/books/rss",
-                "https://rss.nytimes.com/services/xml/rss/nyt/Books.xml",
-                "https://www.tor.com/feed/",
-                "https://lithub.com/feed/",
-                "https://www.goodreads.com/blog/feed"
-            ])
-            self.suggestion_listbox.body[:] = [urwid.Text("📚 Live Suggestions:"), *rss_items]
+            # show cached feeds right away; fresh ones arrive through _on_feed_loaded
+            self._feed_items = {}
+            for url in FEED_URLS:
+                entries = self.feed_loader.cached_entries(url)
+                if entries is not None:
+                    self._feed_items[url] = self.build_feed_items(entries)
+            self.feed_loader.start(FEED_URLS)
+            self._show_feed_items()
         else:
+            self.feed_loader.cancel()
             self.suggestion_listbox.body[:] = [urwid.Text("📚 Suggestions are currently disabled.")]
-        self.loop.draw_screen()
+
+    def _on_feed_loaded(self, url, entries, error):
+        if error:
+            logging.error(f"Feed {url} failed: {error}")
+        self._feed_items[url] = self.build_feed_items(entries)
+        self._show_feed_items()
+
+    def _show_feed_items(self):
+        """Feeds in configured order, whichever have arrived, plus a line for the rest."""
+        body = [urwid.Text("📚 Live Suggestions:")]
+        for url in FEED_URLS:
+            body.extend(self._feed_items.get(url, []))
+        pending = len(FEED_URLS) - len(self._feed_items)
+        if pending:
+            body.append(urwid.Text(f"⏳ Loading {pending} more feed(s)…"))
+        self.suggestion_listbox.body[:] = body
 
     def open_link(self, button, link):
         # Display the link in a popup dialog with close button
@@ -1849,41 +2199,65 @@ class CalibreUI:
             print(f"\n⚠️ Could not save link: {e}")
         self.loop.draw_screen()
 
-    def fetch_rss_suggestions(self, urls, max_items=2):
+    def build_feed_items(self, entries):
         items = []
-        for url in urls:
-            feed = feedparser.parse(url)
-            for entry in feed.entries[:max_items]:
-                title = entry.title
-                summary = entry.get("summary", "")
-                link = entry.get("link", "")
-                extracted_link = extract_first_link(summary)
-                if extracted_link:
-                    link_to_use = extracted_link
-                elif link:
-                    link_to_use = link
-                else:
-                    link_to_use = None
-                items.append(urwid.Padding(urwid.Text(f"• {title}", wrap='space'), left=1, right=1))
-                items.append(urwid.Padding(urwid.Text(re.sub('<.*?>', '', summary.strip()), wrap='space'), left=1, right=1))
-                if link_to_use:
-                    # Truncate link for display - show domain + path snippet
-                    display_link = self._truncate_link(link_to_use)
-                    link_btn = urwid.Button(f"📎 {display_link}")
-                    urwid.connect_signal(link_btn, 'click', self.open_link, user_arg=link_to_use)
-                    items.append(urwid.Padding(urwid.AttrMap(link_btn, 'selected', focus_map='reversed'), left=1, right=1))
-                else:
-                    items.append(urwid.Padding(urwid.Text("No link found.", wrap='space'), left=1, right=1))
+        for entry in entries:
+            title = entry["title"]
+            summary = entry["summary"]
+            link = entry.get("link", "")
+            extracted_link = extract_first_link(summary)
+            if extracted_link:
+                link_to_use = extracted_link
+            elif link:
+                link_to_use = link
+            else:
+                link_to_use = None
+            items.append(urwid.Padding(urwid.Text(f"• {title}", wrap='space'), left=1, right=1))
+            items.append(urwid.Padding(urwid.Text(re.sub('<.*?>', '', summary.strip()), wrap='space'), left=1, right=1))
+            if link_to_use:
+                # Truncate link for display - show domain + path snippet
+                display_link = self._truncate_link(link_to_use)
+                link_btn = urwid.Button(f"📎 {display_link}")
+                urwid.connect_signal(link_btn, 'click', self.open_link, user_arg=link_to_use)
+                items.append(urwid.Padding(urwid.AttrMap(link_btn, 'selected', focus_map='reversed'), left=1, right=1))
+            else:
+                items.append(urwid.Padding(urwid.Text("No link found.", wrap='space'), left=1, right=1))
         return items
 
     def run(self):
-        self.loop.run()
+        if self.startup_profile:
+            self.loop.set_alarm_in(0, self._exit_after_first_frame)
+        loop_started = time.perf_counter()
+        try:
+            self.loop.run()
+        finally:
+            self.prefetcher.cancel()
+            self.query_worker.close()
+            self.feed_loader.close()
+            if self.write_stats:
+                self.usage_tracker.export_stats(os.path.join(SCRIPT_DIR, "combo_cache_stats.json"))
+            if self.write_stats:
+                try:
+                    with open(os.path.join(SCRIPT_DIR, "ui_activity_stats.json"), "w", encoding="utf-8") as f:
+                        json.dump(self.activity_stats(), f, indent=2)
+                except Exception as e:
+                    print(f"⚠️ Failed to export activity stats: {e}")
+            self.usage_tracker.close()
+        if self.startup_profile:
+            self.report_startup_profile(loop_started)
+
+    def _exit_after_first_frame(self, loop, user_data):
+        # wait for the loading frame and for the engine (its phases are part of the report)
+        if getattr(loop.screen, "first_draw_done", None) is None or self.engine_loading:
+            loop.set_alarm_in(0.01, self._exit_after_first_frame)
+            return
+        raise urwid.ExitMainLoop()
 
 # Entry point
 if __name__ == "__main__":
     print("🚀 Launching CalibreSynapse Urwid TUI with Enhanced Panels...")
     try:
-        CalibreUI().run()
+        CalibreUI(startup_profile="--startup-profile" in sys.argv[1:], write_stats="--stats" in sys.argv[1:]).run()
     except Exception as e:
         logging.error("Unhandled exception", exc_info=True)
         print(f"❌ Application crashed: {e}")
@@ -0,0 +1,368 @@
+import heapq
+import json
+import os
+import sqlite3
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; sessions then aren't serialized
+    fcntl = None
+
+# Reserved top-level key holding usage statistics inside the JSON document.
+# Combo keys are JSON arrays/objects, so they can never collide with it.
+STATS_KEY = "__stats__"
+
+# Per-key counters that are added together when stats are written back
+ADDITIVE_STATS = ("hits", "misses")
+
+
+def merge_stats(current, update):
+    """Apply a write-back update: counters are added, everything else replaced."""
+    merged = dict(current or {})
+    for name, value in update.items():
+        if name in ADDITIVE_STATS:
+            merged[name] = merged.get(name, 0) + value
+        else:
+            merged[name] = value
+    return merged
+
+
+@contextmanager
+def file_lock(lock_path, exclusive):
+    """Advisory lock shared by every process using the same cache file."""
+    if fcntl is None:
+        yield
+        return
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class JSONComboStore:
+    """
+    Original storage: the whole cache is one JSON document.
+
+    Safe to share between several running sessions: every write takes an
+    exclusive lock on <path>.lock, re-reads the document if another process
+    changed it, re-applies this session's change on top and replaces the file
+    atomically. A lookup that misses re-reads the document when it changed on
+    disk, so queries computed by another session are picked up.
+    Usage statistics are buffered and written with the next store or on close.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.cache = {}
+        self.stats = {"keys": {}, "meta": {}}
+        self._signature = None
+        self._pending_stats = {}  # key -> update not yet written to disk
+        self._pending_meta = {}   # name -> ("add" | "max", value)
+        with file_lock(self.lock_path, exclusive=False):
+            self._load()
+
+    def get(self, key):
+        if key not in self.cache and self._changed_on_disk():
+            with file_lock(self.lock_path, exclusive=False):
+                self._load()
+        return self.cache.get(key)
+
+    def contains(self, key):
+        return key in self.cache
+
+    def put(self, key, entry):
+        self.put_many({key: entry})
+
+    def put_many(self, entries, deleted=()):
+        """Write entries and delete keys with a single rewrite of the document."""
+        def change(cache):
+            for key in deleted:
+                cache.pop(key, None)
+            cache.update(entries)
+        self._write(change)
+
+    def delete(self, key):
+        if key in self.cache:
+            self._write(lambda cache: cache.pop(key, None))
+
+    def clear(self):
+        self._write(lambda cache: cache.clear())
+
+    def keys(self):
+        return list(self.cache.keys())
+
+    def count(self):
+        return len(self.cache)
+
+    def get_stats(self, key):
+        return self.stats["keys"].get(key)
+
+    def all_stats(self):
+        return dict(self.stats["keys"])
+
+    def update_stats(self, updates):
+        for key, update in updates.items():
+            self._pending_stats[key] = merge_stats(self._pending_stats.get(key), update)
+            self.stats["keys"][key] = merge_stats(self.stats["keys"].get(key), update)
+
+    def lowest_priorities(self, limit):
+        """(key, priority) of the limit cached entries with the lowest eviction priority, lowest first."""
+        key_stats = self.stats["keys"]
+        return heapq.nsmallest(limit, ((key, key_stats.get(key, {}).get("priority") or 0.0) for key in self.cache),
+                               key=lambda victim: victim[1])
+
+    def prune_stats(self, max_rows):
+        """Forget statistics of evicted keys beyond max_rows, least recently used first."""
+        key_stats = self.stats["keys"]
+        if len(key_stats) <= max_rows:
+            return
+        ghosts = sorted((k for k in key_stats if k not in self.cache),
+                        key=lambda k: key_stats[k].get("last_access") or "")
+        for key in ghosts[:len(key_stats) - max_rows]:
+            del key_stats[key]
+            self._pending_stats[key] = None
+
+    def get_meta(self, name, default=None):
+        return self.stats["meta"].get(name, default)
+
+    def add_meta(self, deltas):
+        for name, delta in deltas.items():
+            op, value = self._pending_meta.get(name, ("add", 0))
+            self._pending_meta[name] = ("add", value + delta)
+            self.stats["meta"][name] = self.stats["meta"].get(name, 0) + delta
+
+    def raise_meta(self, values):
+        """Set values that only ever grow (e.g. the eviction inflation)."""
+        for name, value in values.items():
+            self._pending_meta[name] = ("max", value)
+            self.stats["meta"][name] = max(self.stats["meta"].get(name, value), value)
+
+    def close(self):
+        if self._pending_stats or self._pending_meta:
+            self._write(lambda cache: None)
+
+    def _changed_on_disk(self):
+        return file_signature(self.path) != self._signature
+
+    def _load(self):
+        """Read the document from disk and re-apply changes not written yet."""
+        document = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    document = json.load(f)
+            except Exception as e:
+                print(f"⚠️ Failed to load cache: {e}")
+        self._signature = file_signature(self.path)
+        self.stats = document.pop(STATS_KEY, None) or {"keys": {}, "meta": {}}
+        self.cache = document
+
+        key_stats = self.stats["keys"]
+        for key, update in self._pending_stats.items():
+            if update is None:
+                key_stats.pop(key, None)
+            else:
+                key_stats[key] = merge_stats(key_stats.get(key), update)
+        meta = self.stats["meta"]
+        for name, (op, value) in self._pending_meta.items():
+            if op == "add":
+                meta[name] = meta.get(name, 0) + value
+            else:
+                meta[name] = max(meta.get(name, value), value)
+
+    def _write(self, change):
+        with file_lock(self.lock_path, exclusive=True):
+            if self._changed_on_disk():
+                self._load()  # merge entries written by other sessions
+            change(self.cache)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({**self.cache, STATS_KEY: self.stats}, f, indent=2)
+            os.replace(tmp_path, self.path)
+            self._signature = file_signature(self.path)
+            self._pending_stats = {}
+            self._pending_meta = {}
+
+
+class SQLiteComboStore:
+    """
+    One row per combo key in a local SQLite file (WAL mode), values stored as
+    zlib-compressed JSON.
+
+    Nothing is read when the store is opened: get() fetches a single row and
+    put_many() writes its rows in one transaction, so a crash can at worst
+    lose the entries that were being written. Usage statistics live in their own
+    table so eviction can pick a victim through an index instead of a scan.
+    Concurrent sessions share the file through SQLite's own locking; stats
+    counters are applied as increments so no session overwrites another's.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Several sessions may share the file: wait for other writers instead of failing
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS combos (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                timestamp TEXT
+            );
+            CREATE TABLE IF NOT EXISTS combo_stats (
+                key TEXT PRIMARY KEY,
+                hits INTEGER NOT NULL DEFAULT 0,
+                misses INTEGER NOT NULL DEFAULT 0,
+                last_access TEXT,
+                cost_ms REAL,
+                size INTEGER,
+                priority REAL
+            );
+            CREATE INDEX IF NOT EXISTS combo_stats_priority ON combo_stats (priority);
+            CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            );
+        """)
+        self.conn.commit()
+
+    def get(self, key):
+        row = self.conn.execute("SELECT value FROM combos WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        try:
+            return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+        except (zlib.error, ValueError) as e:
+            print(f"⚠️ Dropping unreadable cache entry: {e}")
+            self.delete(key)
+            return None
+
+    def contains(self, key):
+        return self.conn.execute("SELECT 1 FROM combos WHERE key = ?", (key,)).fetchone() is not None
+
+    def put(self, key, entry):
+        self.put_many({key: entry})
+
+    def put_many(self, entries, deleted=()):
+        """Write entries and delete keys in one transaction."""
+        rows = [
+            (key, zlib.compress(json.dumps(entry, separators=(",", ":")).encode("utf-8")), entry.get("timestamp"))
+            for key, entry in entries.items()
+        ]
+        with self.conn:
+            self.conn.executemany("DELETE FROM combos WHERE key = ?", [(key,) for key in deleted])
+            self.conn.executemany("INSERT OR REPLACE INTO combos (key, value, timestamp) VALUES (?, ?, ?)", rows)
+
+    def delete(self, key):
+        with self.conn:
+            self.conn.execute("DELETE FROM combos WHERE key = ?", (key,))
+
+    def clear(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM combos")
+
+    def keys(self):
+        return [row[0] for row in self.conn.execute("SELECT key FROM combos")]
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM combos").fetchone()[0]
+
+    def get_stats(self, key):
+        row = self.conn.execute(
+            "SELECT hits, misses, last_access, cost_ms, size, priority FROM combo_stats WHERE key = ?",
+            (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("hits", "misses", "last_access", "cost_ms", "size", "priority"), row))
+
+    def all_stats(self):
+        rows = self.conn.execute(
+            "SELECT key, hits, misses, last_access, cost_ms, size, priority FROM combo_stats"
+        )
+        return {
+            row[0]: dict(zip(("hits", "misses", "last_access", "cost_ms", "size", "priority"), row[1:]))
+            for row in rows
+        }
+
+    def update_stats(self, updates):
+        with self.conn:
+            for key, update in updates.items():
+                self.conn.execute("""
+                    INSERT INTO combo_stats (key, hits, misses, last_access, cost_ms, size, priority)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (key) DO UPDATE SET
+                        hits = hits + excluded.hits,
+                        misses = misses + excluded.misses,
+                        last_access = COALESCE(excluded.last_access, last_access),
+                        cost_ms = COALESCE(excluded.cost_ms, cost_ms),
+                        size = COALESCE(excluded.size, size),
+                        priority = COALESCE(excluded.priority, priority)
+                """, (key, update.get("hits", 0), update.get("misses", 0), update.get("last_access"),
+                      update.get("cost_ms"), update.get("size"), update.get("priority")))
+
+    def lowest_priorities(self, limit):
+        """(key, priority) of the limit cached entries with the lowest eviction priority, lowest first."""
+        # Entries without stats (written before stats existed) go first
+        victims = [(row[0], 0.0) for row in self.conn.execute(
+            "SELECT c.key FROM combos c LEFT JOIN combo_stats s ON s.key = c.key WHERE s.key IS NULL LIMIT ?",
+            (limit,)
+        )]
+        if len(victims) < limit:
+            victims += [(row[0], row[1]) for row in self.conn.execute("""
+                SELECT s.key, COALESCE(s.priority, 0) FROM combo_stats s
+                WHERE EXISTS (SELECT 1 FROM combos c WHERE c.key = s.key)
+                ORDER BY s.priority LIMIT ?
+            """, (limit - len(victims),))]
+        return victims
+
+    def prune_stats(self, max_rows):
+        """Forget statistics of evicted keys beyond max_rows, least recently used first."""
+        total = self.conn.execute("SELECT COUNT(*) FROM combo_stats").fetchone()[0]
+        if total <= max_rows:
+            return
+        with self.conn:
+            self.conn.execute("""
+                DELETE FROM combo_stats WHERE key IN (
+                    SELECT s.key FROM combo_stats s
+                    WHERE NOT EXISTS (SELECT 1 FROM combos c WHERE c.key = s.key)
+                    ORDER BY s.last_access LIMIT ?
+                )
+            """, (total - max_rows,))
+
+    def get_meta(self, name, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+    def add_meta(self, deltas):
+        with self.conn:
+            for name, delta in deltas.items():
+                self.conn.execute("""
+                    INSERT INTO meta (name, value) VALUES (?, ?)
+                    ON CONFLICT (name) DO UPDATE SET value = value + excluded.value
+                """, (name, delta))
+
+    def raise_meta(self, values):
+        """Set values that only ever grow (e.g. the eviction inflation)."""
+        with self.conn:
+            for name, value in values.items():
+                self.conn.execute("""
+                    INSERT INTO meta (name, value) VALUES (?, ?)
+                    ON CONFLICT (name) DO UPDATE SET value = MAX(value, excluded.value)
+                """, (name, value))
+
+    def close(self):
+        self.conn.close()
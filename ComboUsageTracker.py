@@ -1,58 +1,413 @@
+import hashlib
 import json
-import os
+import threading
+from collections import Counter
 from datetime import datetime
+from ComboCacheStore import JSONComboStore, SQLiteComboStore
+from ExportWriter import read_export
+
+SQLITE_EXTENSIONS = (".sqlite", ".sqlite3", ".db")
+
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_COST_MS = 1.0     # assumed cost of entries stored without a measured query time
+STATS_FLUSH_EVERY = 64    # write usage stats back after this many touched keys
+
+
+def make_combo_key(selected_labels):
+    """
+    Canonical cache key for a selection of (label, field) tuples.
+
+    The key is a JSON array of [field, label] pairs sorted by field then label,
+    so labels containing commas or colons (e.g. Subject) can't collide.
+    """
+    pairs = sorted(([field, label] for label, field in selected_labels), key=lambda p: (p[0] or "", p[1]))
+    return json.dumps(pairs, ensure_ascii=False, separators=(",", ":"))
+
+
+def make_group_key(field, group_name):
+    """Cache key for the books of a label group (OR over its members)."""
+    return json.dumps({"group": [field, group_name]}, ensure_ascii=False, separators=(",", ":"))
+
+
+def combo_key_labels(combo_key):
+    """Return the [field, label] pairs encoded in a selection key ([] for group keys)."""
+    try:
+        decoded = json.loads(combo_key)
+    except ValueError:
+        return []
+    return decoded if isinstance(decoded, list) else []
+
+
+def merge_library_fingerprints(per_library):
+    """
+    Fingerprints of a federation from {library: its label_fingerprints.json}:
+    book ids become "library:book_id" as in FederatedEngine, and a label's
+    fingerprint combines those of every library that has the label, so a
+    re-export of any one library changes it.
+    """
+    label_parts = {}
+    books = {}
+    for name in sorted(per_library):
+        fingerprints = per_library[name]
+        for field, labels in fingerprints.get("labels", {}).items():
+            field_parts = label_parts.setdefault(field, {})
+            for label, fingerprint in labels.items():
+                field_parts.setdefault(label, []).append(f"{name}={fingerprint}")
+        books.update((f"{name}:{book_id}", fingerprint) for book_id, fingerprint in fingerprints.get("books", {}).items())
+    labels = {
+        field: {label: hashlib.sha1(";".join(parts).encode("utf-8")).hexdigest()[:16] for label, parts in field_parts.items()}
+        for field, field_parts in label_parts.items()
+    }
+    return {"labels": labels, "books": books}
+
 
 class ComboUsageTracker:
-    def __init__(self, path="combo_usage_cache.json"):
+    def __init__(self, path="combo_usage_cache.json", backend=None, fingerprints_path=None,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        backend: "json" (one document, loaded at startup) or "sqlite" (one row per
+        combo key, read lazily). If omitted it is picked from the file extension.
+
+        fingerprints_path: label_fingerprints.json written by the builder, or
+        {library: its label_fingerprints.json} for a FederatedEngine. When
+        available (for every library), every entry is tagged with the fingerprints of the postings
+        it was computed from and is dropped on first read if any of them changed.
+
+        max_entries: capacity of the cache. Admission and eviction follow
+        GreedyDual with frequency: an entry's priority is
+        inflation + requests * query cost (ms), the lowest priority entry is
+        evicted and its priority becomes the new inflation value. A new entry is
+        only admitted when the cache is full if it outranks that victim, so
+        one-off cheap combos can't push out expensive, popular ones.
+        """
         self.path = path
-        self.cache = {}
-        if os.path.exists(path):
-            try:
-                with open(path, "r", encoding="utf-8") as f:
-                    self.cache = json.load(f)
-            except Exception as e:
-                print(f"⚠️ Failed to load cache: {e}")
-                self.cache = {}
+        self.lock = threading.RLock()  # the cache warmer stores from a worker thread
+        if backend is None:
+            backend = "sqlite" if path.endswith(SQLITE_EXTENSIONS) else "json"
+        if backend == "sqlite":
+            self.backend = SQLiteComboStore(path)
+        else:
+            self.backend = JSONComboStore(path)
 
-    def get(self, combo_key):
-        return self.cache.get(combo_key)
+        self.fingerprints = None
+        self._validated = set()  # keys already checked against the current fingerprints
+        self.generation = 0  # bumped by load_fingerprints, i.e. whenever the library is reloaded
+        if fingerprints_path:
+            self.load_fingerprints(fingerprints_path)
+
+        self.max_entries = max_entries
+        self.inflation = self.backend.get_meta("inflation", 0.0)
+        self._flushed_inflation = self.inflation
+        self._stats = {}          # key -> stats as seen by this session
+        self._stat_updates = {}   # key -> pending write-back (counters as deltas)
+        self._totals = Counter()  # pending deltas of hits, misses, evictions, rejected
 
-    def store(self, combo_key, result):
+    def load_fingerprints(self, fingerprints_path):
         try:
-            refinable = result.get("refinable_labels", {})
-            books = result.get("books", {})
-
-            # Sanitize refinable_labels: convert tuples to lists
-            refinable_clean = {}
-            for category, label_list in refinable.items():
-                refinable_clean[category] = [
-                    list(item) if isinstance(item, tuple) else item
-                    for item in label_list
-                ]
-
-            # Sanitize books: remove non-serializable fields
-            books_clean = {}
-            for book_id, data in books.items():
-                if isinstance(data, dict):
-                    clean_data = {}
-                    for k, v in data.items():
-                        try:
-                            json.dumps(v)  # test serializability
-                            clean_data[k] = v
-                        except TypeError:
-                            clean_data[k] = str(v)
-                    books_clean[book_id] = clean_data
+            if isinstance(fingerprints_path, dict):
+                fingerprints = merge_library_fingerprints(
+                    {name: read_export(path) for name, path in fingerprints_path.items()}
+                )
+            else:
+                fingerprints = read_export(fingerprints_path)
+        except (FileNotFoundError, ValueError):
+            fingerprints = None
+        with self.lock:
+            self.fingerprints = fingerprints
+            self._validated.clear()
+            self.generation += 1
+
+    def get(self, combo_key):
+        with self.lock:
+            entry = self.backend.get(combo_key)
+            if entry is not None and self.fingerprints is not None and combo_key not in self._validated:
+                if self._is_fresh(entry):
+                    self._validated.add(combo_key)
                 else:
-                    books_clean[book_id] = str(data)
+                    self.backend.delete(combo_key)
+                    entry = None
+            self._record_access(combo_key, hit=entry is not None)
+            return entry
 
-            self.cache[combo_key] = {
-                "refinable_labels": refinable_clean,
-                "books": books_clean,
-                "timestamp": datetime.now().isoformat()
-            }
+    def is_current(self, combo_key):
+        """
+        True if combo_key is cached and still matches the loaded fingerprints,
+        i.e. its result is the same on the reloaded library. Not counted as a
+        hit or miss; always False without fingerprints.
+        """
+        with self.lock:
+            if self.fingerprints is None:
+                return False
+            if combo_key in self._validated:
+                return True
+            entry = self.backend.get(combo_key)
+            if entry is None or not self._is_fresh(entry):
+                return False
+            self._validated.add(combo_key)
+            return True
 
-            with open(self.path, "w", encoding="utf-8") as f:
-                json.dump(self.cache, f, indent=2)
+    def clear(self):
+        """Drop every cached entry; usage statistics are kept."""
+        with self.lock:
+            self.backend.clear()
+            self._validated.clear()
 
+    def contains(self, combo_key):
+        """Membership check that doesn't count as a hit or miss."""
+        with self.lock:
+            return self.backend.contains(combo_key)
+
+    def label_usage(self):
+        """Counter of (field, label) -> cached selections containing it, weighted by their hits."""
+        with self.lock:
+            self._flush_stats()
+            keys = self.backend.keys()
+            key_stats = self.backend.all_stats()
+        usage = Counter()
+        for combo_key in keys:
+            weight = 1 + (key_stats.get(combo_key) or {}).get("hits", 0)
+            for field, label in combo_key_labels(combo_key):
+                usage[(field, label)] += weight
+        return usage
+
+    def store(self, combo_key, result, depends_on=None, cost_ms=None, generation=None):
+        """
+        depends_on: (field, label) pairs whose postings the result was computed
+        from. Defaults to the labels encoded in combo_key.
+        cost_ms: time the query took; drives the eviction priority.
+        generation: self.generation when the query started. A result computed
+        before the library was reloaded is dropped instead of being tagged with
+        the new fingerprints.
+        """
+        try:
+            self._admit([self._prepare_entry(combo_key, result, depends_on, cost_ms)], generation)
         except Exception as e:
             print(f"⚠️ Failed to save cache: {e}")
+
+    def store_many(self, results, generation=None):
+        """
+        Store (combo_key, result, cost_ms) triples with a single backend write,
+        e.g. a prefetched batch; the JSON backend rewrites its whole document
+        on every write.
+        """
+        try:
+            self._admit([self._prepare_entry(combo_key, result, None, cost_ms)
+                         for combo_key, result, cost_ms in results], generation)
+        except Exception as e:
+            print(f"⚠️ Failed to save cache: {e}")
+
+    def _prepare_entry(self, combo_key, result, depends_on, cost_ms):
+        """(combo_key, entry, size, cost_ms) ready to be written; done outside the lock."""
+        refinable = result.get("refinable_labels", {})
+        books = result.get("books", {})
+
+        # Sanitize refinable_labels: convert tuples to lists
+        refinable_clean = {}
+        for category, label_list in refinable.items():
+            refinable_clean[category] = [
+                list(item) if isinstance(item, tuple) else item
+                for item in label_list
+            ]
+
+        # Sanitize books: remove non-serializable fields
+        books_clean = {}
+        for book_id, data in books.items():
+            if isinstance(data, dict):
+                clean_data = {}
+                for k, v in data.items():
+                    try:
+                        json.dumps(v)  # test serializability
+                        clean_data[k] = v
+                    except TypeError:
+                        clean_data[k] = str(v)
+                books_clean[book_id] = clean_data
+            else:
+                books_clean[book_id] = str(data)
+
+        entry = {
+            "refinable_labels": refinable_clean,
+            "books": books_clean,
+            "timestamp": datetime.now().isoformat()
+        }
+        if self.fingerprints is not None:
+            if depends_on is None:
+                depends_on = combo_key_labels(combo_key)
+            entry["fingerprints"] = {
+                "labels": [[field, label, self._label_fingerprint(field, label)] for field, label in depends_on],
+                "books": self._books_digest(books_clean)
+            }
+
+        size = len(json.dumps(entry, separators=(",", ":")))
+        return combo_key, entry, size, cost_ms
+
+    def _admit(self, prepared, generation):
+        """
+        Admit prepared entries and write them, and the entries they evict, in
+        one backend call. When the cache is full the highest priority newcomers
+        take the free slots first; each other one evicts the lowest priority
+        resident entry if it outranks it and is rejected otherwise.
+        """
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            candidates = []
+            for combo_key, entry, size, cost_ms in prepared:
+                stats = self._key_stats(combo_key)
+                if cost_ms is not None:
+                    stats["cost_ms"] = cost_ms
+                candidates.append((combo_key, entry, size, stats))
+            keys = {combo_key for combo_key, _, _, _ in candidates}
+            new = [candidate for candidate in candidates if not self.backend.contains(candidate[0])]
+
+            rejected = set()
+            evicted = []
+            free = self.max_entries - self.backend.count() if self.max_entries else len(new)
+            if len(new) > free:
+                self._flush_stats()
+                # another session may have evicted (and inflated) since we last looked
+                self.inflation = max(self.inflation, self.backend.get_meta("inflation", 0.0))
+                wanted = len(new) - max(free, 0)
+                victims = [victim for victim in self.backend.lowest_priorities(wanted + len(keys))
+                           if victim[0] not in keys][:wanted]
+                for combo_key, _, _, stats in sorted(new, key=lambda candidate: -self._priority(candidate[3])):
+                    if free > 0:
+                        free -= 1
+                        continue
+                    if not victims or self._priority(stats) < victims[0][1]:
+                        self._totals["rejected"] += 1
+                        self._update_stats(combo_key, cost_ms=stats["cost_ms"])
+                        rejected.add(combo_key)
+                        continue
+                    victim_key, victim_priority = victims.pop(0)
+                    evicted.append(victim_key)
+                    self._validated.discard(victim_key)
+                    self.inflation = max(self.inflation, victim_priority)
+                    self._totals["evictions"] += 1
+
+            entries = {}
+            for combo_key, entry, size, stats in candidates:
+                if combo_key in rejected:
+                    continue
+                if self.fingerprints is not None:
+                    self._validated.add(combo_key)
+                self._update_stats(combo_key, cost_ms=stats["cost_ms"], size=size, priority=self._priority(stats))
+                entries[combo_key] = entry
+            self._flush_stats()
+            if entries or evicted:
+                self.backend.put_many(entries, evicted)
+            if evicted:
+                self.backend.prune_stats(self.max_entries * 4)
+
+    def _key_stats(self, combo_key):
+        stats = self._stats.get(combo_key)
+        if stats is None:
+            stats = {"hits": 0, "misses": 0, "last_access": None, "cost_ms": None, "size": None, "priority": 0.0}
+            stored = self.backend.get_stats(combo_key) or {}
+            stats.update({k: v for k, v in stored.items() if v is not None})
+            self._stats[combo_key] = stats
+        if stats.get("cost_ms") is None:
+            stats["cost_ms"] = DEFAULT_COST_MS
+        return stats
+
+    def _priority(self, stats):
+        requests = max(1, stats["hits"] + stats["misses"])
+        return self.inflation + requests * stats["cost_ms"]
+
+    def _update_stats(self, combo_key, **values):
+        """Apply a change to the session view and queue it for write-back."""
+        stats = self._key_stats(combo_key)
+        pending = self._stat_updates.setdefault(combo_key, {})
+        for name, value in values.items():
+            if name in ("hits", "misses"):
+                stats[name] += value
+                pending[name] = pending.get(name, 0) + value
+            else:
+                stats[name] = value
+                pending[name] = value
+
+    def _record_access(self, combo_key, hit):
+        now = datetime.now().isoformat()
+        if hit:
+            self._totals["hits"] += 1
+            self._update_stats(combo_key, hits=1, last_access=now)
+            self._update_stats(combo_key, priority=self._priority(self._key_stats(combo_key)))
+        else:
+            self._totals["misses"] += 1
+            self._update_stats(combo_key, misses=1, last_access=now)
+        if len(self._stat_updates) >= STATS_FLUSH_EVERY:
+            self._flush_stats()
+
+    def _flush_stats(self):
+        if self._stat_updates:
+            self.backend.update_stats(self._stat_updates)
+            self._stat_updates = {}
+        if self._totals:
+            self.backend.add_meta(dict(self._totals))
+            self._totals = Counter()
+        if self.inflation != self._flushed_inflation:
+            self.backend.raise_meta({"inflation": self.inflation})
+            self._flushed_inflation = self.inflation
+
+    def stats_summary(self, top_n=20):
+        """Aggregate usage statistics of the cache (all sessions, persisted)."""
+        with self.lock:
+            self._flush_stats()
+            key_stats = self.backend.all_stats()
+            resident = set(self.backend.keys())
+            hits = int(self.backend.get_meta("hits", 0))
+            misses = int(self.backend.get_meta("misses", 0))
+            evictions = int(self.backend.get_meta("evictions", 0))
+            rejected = int(self.backend.get_meta("rejected", 0))
+
+        resident_stats = [s for k, s in key_stats.items() if k in resident]
+        costs = [s["cost_ms"] for s in resident_stats if s.get("cost_ms") is not None]
+        top = sorted(
+            ({"key": k, "resident": k in resident, **s} for k, s in key_stats.items()),
+            key=lambda item: (-item.get("hits", 0), -(item.get("cost_ms") or 0))
+        )[:top_n]
+        return {
+            "entries": len(resident),
+            "max_entries": self.max_entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+            "evictions": evictions,
+            "rejected_admissions": rejected,
+            "inflation": self.inflation,
+            "avg_cost_ms": round(sum(costs) / len(costs), 3) if costs else None,
+            "saved_ms": round(sum(s.get("hits", 0) * (s.get("cost_ms") or 0) for s in key_stats.values()), 3),
+            "cached_bytes": sum(s.get("size") or 0 for s in resident_stats),
+            "top_keys": top
+        }
+
+    def export_stats(self, path):
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.stats_summary(), f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            print(f"⚠️ Failed to export cache stats: {e}")
+
+    def _label_fingerprint(self, field, label):
+        return self.fingerprints.get("labels", {}).get(field, {}).get(label)
+
+    def _books_digest(self, book_ids):
+        """Digest of the current fingerprints of the books in a result."""
+        book_fps = self.fingerprints.get("books", {})
+        digest = hashlib.sha1()
+        for book_id in sorted(book_ids):
+            digest.update(f"{book_id}:{book_fps.get(book_id)}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _is_fresh(self, entry):
+        tag = entry.get("fingerprints")
+        if not tag:
+            return False  # written before fingerprints existed
+        for field, label, fingerprint in tag.get("labels", []):
+            if self._label_fingerprint(field, label) != fingerprint:
+                return False
+        return tag.get("books") == self._books_digest(entry.get("books", {}))
+
+    def close(self):
+        with self.lock:
+            self._flush_stats()
+            self.backend.close()
@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+"""
+Optional long-lived engine daemon: loads the library once and serves it to
+CalibreSynapseTUI.py and CalibreSynapseQuery.py over a local UNIX socket, so
+they start without loading the engine and share one copy of it.
+
+    python3 EngineDaemon.py                      # library next to this script
+    python3 EngineDaemon.py --library-dir DIR --socket PATH
+
+Clients call open_engine(library_dir), which returns a RemoteEngine when a
+daemon serves that library and falls back to loading a CalibreEngine
+in-process when none is running.
+
+The daemon reloads the library (and bumps its generation, which connected
+RemoteEngines report as stale) when the builder finishes a new export, on
+SIGHUP, and on a "reload" request such as the one LibraryWatcher.py sends.
+
+Protocol: every message is a frame made of a 4-byte big-endian payload length
+followed by compact UTF-8 JSON. A request is {"op": name, "args": {...}}, the
+reply {"ok": result} or {"error": message}; a connection carries any number of
+requests, answered in order.
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from CalibreEngine import CalibreEngine
+from FacetSnapshot import FacetSnapshot
+from FederatedEngine import FederatedEngine, read_libraries
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+SOCKET_NAME = "calibre_engine.sock"
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME = 512 * 1024 * 1024
+CHECK_INTERVAL = 5  # seconds between checks for a newer export
+
+
+def default_socket_path(library_dir):
+    return os.path.join(library_dir, SOCKET_NAME)
+
+
+def load_local_engine(library_dir):
+    """The library in library_dir, or the federation its libraries.json lists, loaded in this process."""
+    libraries = read_libraries(library_dir)
+    if libraries:
+        return FederatedEngine(libraries, label_groups_path=os.path.join(library_dir, "label_groups.json"))
+    return load_single_engine(library_dir)
+
+
+def load_single_engine(library_dir):
+    parser_path = os.path.join(library_dir, "vocabulary_parser.json")
+    if not os.path.exists(parser_path):
+        parser_path = os.path.join(SCRIPT_DIR, "vocabulary_parser.json")  # shared, like the builder's
+    return CalibreEngine(
+        label_map_path=os.path.join(library_dir, "semantic_label_map.json"),
+        vocab_path=os.path.join(library_dir, "dynamic_vocabulary.json"),
+        parser_path=parser_path,
+        label_groups_path=os.path.join(library_dir, "label_groups.json")
+    )
+
+
+def open_engine(library_dir, socket_path=None):
+    """A RemoteEngine if a daemon serves library_dir, otherwise a CalibreEngine loaded in-process."""
+    engine = RemoteEngine.connect(socket_path or default_socket_path(library_dir), library_dir)
+    if engine is not None:
+        return engine
+    return load_local_engine(library_dir)
+
+
+# ---------------------------------------------------------------- framing
+
+def _json_default(value):
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def send_frame(sock, message):
+    payload = json.dumps(message, separators=(",", ":"), ensure_ascii=False, default=_json_default).encode("utf-8")
+    sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def recv_frame(sock):
+    """The next message, or None when the peer closed the connection between frames."""
+    header = _recv_exactly(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME:
+        raise ValueError(f"frame of {length} bytes exceeds the {MAX_FRAME} byte limit")
+    payload = _recv_exactly(sock, length)
+    if payload is None:
+        raise ConnectionError("connection closed in the middle of a frame")
+    return json.loads(payload.decode("utf-8"))
+
+
+def send_request(socket_path, op, **args):
+    """One request on a fresh connection (for short-lived callers like LibraryWatcher.py)."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        send_frame(sock, {"op": op, "args": args})
+        reply = recv_frame(sock)
+    if reply is None:
+        raise ConnectionError("engine daemon closed the connection")
+    if "error" in reply:
+        raise RuntimeError(f"engine daemon: {reply['error']}")
+    return reply["ok"]
+
+
+def _recv_exactly(sock, size):
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(min(size - len(buf), 1024 * 1024))
+        if not chunk:
+            if buf:
+                raise ConnectionError("connection closed in the middle of a frame")
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+# ---------------------------------------------------------------- server
+
+class EngineRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                request = recv_frame(self.request)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Dropped client: {e}", file=sys.stderr)
+                return
+            if request is None:
+                return
+            try:
+                reply = {"ok": self.server.dispatch(request.get("op"), request.get("args") or {})}
+            except Exception as e:
+                reply = {"error": f"{type(e).__name__}: {e}"}
+            try:
+                send_frame(self.request, reply)
+            except OSError:
+                return
+
+
+class EngineDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves one CalibreEngine to any number of local clients, one thread per connection."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, engine, library_dir):
+        self.engine = engine
+        self.generation = 1  # bumped by every reload
+        self.library_dir = os.path.realpath(library_dir)
+        self.started = time.time()
+        self._groups_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        super().__init__(socket_path, EngineRequestHandler)
+
+    def reload(self):
+        """
+        Load the library again and swap the new engine in. Requests keep being
+        answered by the old engine until the swap; one that started before it
+        finishes on the old engine.
+        """
+        with self._reload_lock:
+            started = time.perf_counter()
+            try:
+                engine = load_local_engine(self.library_dir)
+            except Exception as e:
+                print(f"❌ Reload failed, still serving generation {self.generation}: {e}", file=sys.stderr)
+                return self.generation
+            old_engine, self.engine = self.engine, engine
+            self.generation += 1
+            print(f"🔄 Reloaded in {time.perf_counter() - started:.2f}s ({len(engine.label_map)} books), "
+                  f"generation {self.generation}", file=sys.stderr)
+        close = getattr(old_engine, "close", None)
+        if close is not None:
+            close()  # a FederatedEngine's worker processes
+        return self.generation
+
+    def watch_exports(self, interval=CHECK_INTERVAL):
+        """Reload whenever the builder finishes a newer export (runs on its own thread)."""
+        while True:
+            time.sleep(interval)
+            try:
+                if self.engine.is_stale():
+                    self.reload()
+            except Exception as e:
+                print(f"⚠️ Export check failed: {e}", file=sys.stderr)
+
+    def dispatch(self, op, args):
+        engine = self.engine
+        if op == "hello":
+            return {"library_dir": self.library_dir, "pid": os.getpid(), "started": self.started,
+                    "generation": self.generation}
+        if op == "reload":
+            return self.reload()
+        if op == "metadata":
+            return {
+                "generation": self.generation,
+                "book_count": len(engine.label_map),
+                "dynamic_vocab": engine.dynamic_vocab,
+                "parser": engine.parser,
+                "label_groups": engine.label_groups
+            }
+        if op == "save_label_groups":
+            with self._groups_lock:
+                return answer_engine_op(engine, op, args)
+        return answer_engine_op(engine, op, args)
+
+
+def answer_engine_op(engine, op, args):
+    """Reply to a request that only needs the engine (everything but hello, reload and metadata)."""
+    if op == "query":
+        return engine.query(args["labels"])
+    if op == "query_batch":
+        return engine.query_batch(args["selections"])
+    if op == "facets":
+        return engine.facet_snapshot(args.get("book_ids")).to_state()
+    if op == "books":
+        engine.preload_books(args["book_ids"])
+        label_map = engine.label_map
+        return {book_id: label_map[book_id] for book_id in args["book_ids"] if book_id in label_map}
+    if op == "label_books":
+        return [engine.label_to_books.get((field, label), ()) for field, label in args["keys"]]
+    if op == "save_label_groups":
+        engine.label_groups = args["label_groups"]
+        engine._build_group_member_lookup()
+        engine.save_label_groups()
+        return True
+    raise ValueError(f"unknown op {op!r}")
+
+
+def socket_in_use(socket_path):
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+# ---------------------------------------------------------------- client
+
+class RemoteLabelMap:
+    """
+    Read-only stand-in for CalibreEngine.label_map: book records are fetched
+    from the daemon on first use and kept for the rest of the session.
+    """
+
+    def __init__(self, engine, book_count):
+        self._engine = engine
+        self._book_count = book_count
+        self._books = {}
+        self._missing = set()
+
+    def load(self, book_ids):
+        wanted = [book_id for book_id in book_ids if book_id not in self._books and book_id not in self._missing]
+        if not wanted:
+            return
+        found = self._engine.call("books", book_ids=wanted)
+        self._books.update(found)
+        self._missing.update(book_id for book_id in wanted if book_id not in found)
+
+    def get(self, book_id, default=None):
+        if book_id not in self._books and book_id not in self._missing:
+            self.load([book_id])
+        return self._books.get(book_id, default)
+
+    def __getitem__(self, book_id):
+        info = self.get(book_id)
+        if info is None:
+            raise KeyError(book_id)
+        return info
+
+    def __contains__(self, book_id):
+        return self.get(book_id) is not None
+
+    def __len__(self):
+        return self._book_count
+
+
+class RemoteLabelToBooks:
+    """Read-only stand-in for CalibreEngine.label_to_books, fetched per (field, label) key."""
+
+    def __init__(self, engine):
+        self._engine = engine
+        self._postings = {}
+
+    def get(self, key, default=None):
+        if key not in self._postings:
+            (books,) = self._engine.call("label_books", keys=[key])
+            self._postings[key] = set(books)
+        return self._postings[key] or default
+
+
+class RemoteEngine(CalibreEngine):
+    """
+    CalibreEngine backed by an EngineDaemon. Vocabulary, parser and label
+    groups are copied at connect time (they are small and read constantly);
+    queries, facet snapshots, book records and postings are requested from the
+    daemon. Each thread talks over its own connection.
+
+    If the daemon goes away, the library in library_dir is loaded in-process
+    and answers every later request, so callers never see the lost connection.
+    """
+
+    def __init__(self, socket_path, library_dir=None):
+        self.socket_path = socket_path
+        self.library_dir = library_dir
+        self._local = threading.local()
+        self._sockets = set()  # every thread's connection, for close()
+        self._sockets_lock = threading.Lock()
+        self._fallback = None
+        self._fallback_lock = threading.Lock()
+        self._closed = False
+        metadata = self.call("metadata")
+        self.version = metadata["generation"]
+        self.dynamic_vocab = metadata["dynamic_vocab"]
+        self.parser = metadata["parser"]
+        self.label_groups = metadata["label_groups"]
+        self.label_map = RemoteLabelMap(self, metadata["book_count"])
+        self.label_to_books = RemoteLabelToBooks(self)
+        self.normalized_parser_labels = self._build_normalized_parser_labels()
+        self.label_to_category = self._build_reverse_label_lookup()
+        self._build_group_member_lookup()
+
+    @classmethod
+    def connect(cls, socket_path, library_dir=None):
+        """A RemoteEngine, or None if no daemon (for library_dir) listens on socket_path."""
+        if not os.path.exists(socket_path):
+            return None
+        engine = None
+        try:
+            engine = cls(socket_path, library_dir)
+            if library_dir is not None:
+                served = engine.call("hello")["library_dir"]
+                if served != os.path.realpath(library_dir):
+                    print(f"⚠️ Engine daemon at {socket_path} serves {served}, not {library_dir}")
+                    engine.close()
+                    return None
+            return engine
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"⚠️ Engine daemon unavailable ({e}), loading the library in-process")
+            if engine is not None:
+                engine.close()
+            return None
+
+    def is_stale(self):
+        """
+        True once the daemon has reloaded the library since this client
+        connected, or has gone away: either way open_engine() is due again.
+        """
+        if self._fallback is not None:
+            return self._fallback.is_stale()
+        try:
+            return self.call("hello")["generation"] != self.version
+        except ConnectionError:
+            return True
+
+    def _connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            self._local.sock = sock
+            with self._sockets_lock:
+                self._sockets.add(sock)
+        return sock
+
+    def _drop_connection(self, sock):
+        self._local.sock = None
+        with self._sockets_lock:
+            self._sockets.discard(sock)
+        sock.close()
+
+    def call(self, op, **args):
+        if self._fallback is not None:
+            return answer_engine_op(self._fallback, op, args)
+        try:
+            sock = self._connection()
+            try:
+                send_frame(sock, {"op": op, "args": args})
+                reply = recv_frame(sock)
+            except OSError:
+                self._drop_connection(sock)
+                raise
+            if reply is None:
+                self._drop_connection(sock)
+                raise ConnectionError("engine daemon closed the connection")
+        except OSError as e:
+            # ConnectionError, BrokenPipeError, a removed socket file...
+            if op in ("hello", "metadata") or not self._fall_back(e):
+                raise ConnectionError(f"engine daemon unavailable: {e}") from e
+            return answer_engine_op(self._fallback, op, args)
+        if "error" in reply:
+            raise RuntimeError(f"engine daemon: {reply['error']}")
+        return reply["ok"]
+
+    def _fall_back(self, error):
+        """Load library_dir in-process after losing the daemon; False if that isn't possible."""
+        if self.library_dir is None or self._closed:
+            return False  # a closed engine's calls are from discarded work
+        with self._fallback_lock:
+            if self._fallback is None:
+                print(f"⚠️ Lost the engine daemon ({error}), loading the library in-process")
+                try:
+                    self._fallback = load_local_engine(self.library_dir)
+                except Exception as e:
+                    print(f"❌ Loading the library in-process failed: {e}")
+                    return False
+        return True
+
+    def close(self):
+        """Close every thread's connection (and the in-process engine loaded after losing the daemon)."""
+        self._closed = True
+        with self._sockets_lock:
+            sockets, self._sockets = self._sockets, set()
+        for sock in sockets:
+            sock.close()
+        close = getattr(self._fallback, "close", None)
+        if close is not None:
+            close()
+
+    def query(self, input_labels, cancel_event=None):
+        # the daemon can't be interrupted mid-query; a cancelled result is dropped on arrival
+        result = self.call("query", labels=input_labels)
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        return result
+
+    def query_batch(self, selections, cancel_event=None):
+        results = self.call("query_batch", selections=selections)
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        return results
+
+    def facet_snapshot(self, book_ids=None):
+        return FacetSnapshot.from_state(self.call("facets", book_ids=None if book_ids is None else list(book_ids)))
+
+    def preload_books(self, book_ids):
+        self.label_map.load(book_ids)
+
+    def save_label_groups(self, label_groups_path=None):
+        self._build_group_member_lookup()
+        self.call("save_label_groups", label_groups=self.label_groups)
+
+
+# ---------------------------------------------------------------- main
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a CalibreSynapse library over a local UNIX socket.")
+    parser.add_argument("--library-dir", default=SCRIPT_DIR,
+                        help="directory holding semantic_label_map.json and friends (default: next to this script)")
+    parser.add_argument("--socket", default=None,
+                        help=f"socket path (default: {SOCKET_NAME} in the library directory)")
+    args = parser.parse_args(argv)
+    socket_path = args.socket or default_socket_path(args.library_dir)
+
+    if os.path.exists(socket_path):
+        if socket_in_use(socket_path):
+            print(f"❌ An engine daemon is already listening on {socket_path}", file=sys.stderr)
+            return 1
+        os.unlink(socket_path)  # left over from a daemon that didn't shut down cleanly
+
+    started = time.perf_counter()
+    engine = load_local_engine(args.library_dir)
+    print(f"✅ Engine loaded in {time.perf_counter() - started:.2f}s ({len(engine.label_map)} books)", file=sys.stderr)
+
+    server = EngineDaemon(socket_path, engine, args.library_dir)
+    os.chmod(socket_path, 0o600)
+    # SIGTERM stops serve_forever from another thread, like Ctrl+C does for SIGINT
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(target=server.reload, daemon=True).start())
+    threading.Thread(target=server.watch_exports, name="export-watch", daemon=True).start()
+    print(f"🔌 Serving on {socket_path}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.unlink(socket_path)
+        except FileNotFoundError:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
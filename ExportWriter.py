@@ -0,0 +1,166 @@
+import codecs
+import json
+import os
+import re
+import zlib
+
+# Formats of the builder's export files. Every file keeps its name in every
+# format; read_export() tells them apart by the first byte.
+#   json     indented JSON (indent=2), readable and diff-friendly
+#   compact  JSON without whitespace
+#   binary   compact JSON, zlib-compressed
+FORMATS = ("json", "compact", "binary")
+ZLIB_LEVEL = 6
+_ZLIB_MAGIC = b"\x78"  # first byte of a zlib stream; never the start of a JSON document
+READ_CHUNK = 1024 * 1024
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def read_export(path):
+    """Load an export file in any of the FORMATS; ValueError if it is damaged."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:1] == _ZLIB_MAGIC:
+        try:
+            data = zlib.decompress(data)
+        except zlib.error as e:
+            raise ValueError(f"{path}: damaged compressed export ({e})") from e
+    return json.loads(data)
+
+
+def iter_export(path):
+    """
+    (key, value) of an export file's top-level object, in file order, for
+    any of the FORMATS. The file is decoded a chunk at a time, so only one
+    entry is held in memory; ValueError if it is damaged.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "rb") as f:
+        data = f.read(READ_CHUNK)
+        decompressor = zlib.decompressobj() if data[:1] == _ZLIB_MAGIC else None
+        text_decoder = codecs.getincrementaldecoder("utf-8")()
+        text, pos, eof = "", 0, False
+
+        def read_more():
+            nonlocal data, text, pos, eof
+            if data is None:
+                data = f.read(READ_CHUNK)
+            eof = not data
+            try:
+                if decompressor is not None:
+                    data = decompressor.decompress(data) if data else decompressor.flush()
+                text = text[pos:] + text_decoder.decode(data, final=eof)
+            except (zlib.error, UnicodeDecodeError) as e:
+                raise ValueError(f"{path}: damaged export ({e})") from e
+            pos = 0
+            data = None
+
+        def next_char():
+            """The next non-whitespace character, consumed."""
+            nonlocal pos
+            while True:
+                pos = _WHITESPACE.match(text, pos).end()
+                if pos < len(text):
+                    pos += 1
+                    return text[pos - 1]
+                if eof:
+                    raise ValueError(f"{path}: export ends in the middle of the document")
+                read_more()
+
+        def next_value():
+            """The next JSON value, consumed once something follows it (so it can't be cut short)."""
+            nonlocal pos
+            while True:
+                pos = _WHITESPACE.match(text, pos).end()
+                try:
+                    value, end = decoder.raw_decode(text, pos)
+                    if eof or _WHITESPACE.match(text, end).end() < len(text):
+                        pos = end
+                        return value
+                except ValueError as e:
+                    if eof:
+                        raise ValueError(f"{path}: damaged export ({e})") from e
+                read_more()
+
+        read_more()
+        if next_char() != "{":
+            raise ValueError(f"{path}: export is not a JSON object")
+        separator = next_char()
+        while separator != "}":
+            if separator != ",":
+                pos -= 1  # the first key
+            key = next_value()
+            if next_char() != ":":
+                raise ValueError(f"{path}: damaged export (expected ':' after {key!r})")
+            yield key, next_value()
+            separator = next_char()
+            if separator not in ",}":
+                raise ValueError(f"{path}: damaged export (unexpected {separator!r})")
+
+
+class ExportWriter:
+    """
+    Writes one export file's top-level JSON object entry by entry, so the
+    builder never holds the whole document, or its encoded text, in memory.
+
+    In the json format the bytes are exactly what json.dump(obj, f, indent=2,
+    ensure_ascii=False) writes. The file is written under a temporary name and
+    moved into place by close(), so a reader never sees half an export; if
+    the with-block raises, the previous file is left untouched.
+    """
+
+    def __init__(self, path, fmt="json"):
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown export format {fmt!r} (expected one of {', '.join(FORMATS)})")
+        self.path = path
+        self.fmt = fmt
+        self.count = 0
+        self._tmp_path = f"{path}.{os.getpid()}.tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._compressor = zlib.compressobj(ZLIB_LEVEL) if fmt == "binary" else None
+
+    def _emit(self, text):
+        data = text.encode("utf-8")
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self._file.write(data)
+
+    def write(self, key, value):
+        if self.fmt == "json":
+            # strings never contain a raw newline, so this only re-indents the structure
+            value_text = json.dumps(value, indent=2, ensure_ascii=False).replace("\n", "\n  ")
+            self._emit(f"{',' if self.count else '{'}\n  {json.dumps(key, ensure_ascii=False)}: {value_text}")
+        else:
+            value_text = json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+            self._emit(f"{',' if self.count else '{'}{json.dumps(key, ensure_ascii=False)}:{value_text}")
+        self.count += 1
+
+    def update(self, mapping):
+        for key, value in mapping.items():
+            self.write(key, value)
+
+    def close(self):
+        if not self.count:
+            self._emit("{}")
+        else:
+            self._emit("\n}" if self.fmt == "json" else "}")
+        if self._compressor is not None:
+            self._file.write(self._compressor.flush())
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,85 @@
+class FacetSnapshot:
+    """
+    Label facets of one set of books, computed in a single pass.
+
+    For every field it holds which labels occur in the books (presence) and how
+    many distinct entries carry each label, where all volumes of a series count
+    as one entry and standalone books count individually. The label pane reads
+    grey-out state, group totals, filtered label lists and counts from one
+    snapshot instead of re-scanning the result books for every field.
+    """
+
+    def __init__(self, label_map, book_ids):
+        self.book_count = 0
+        self._presence = {}  # field -> set of label keys (lowercase)
+        entries = {}         # field -> {label key -> set of series names / book ids}
+
+        for book_id in book_ids:
+            info = label_map.get(book_id)
+            if not info:
+                continue
+            self.book_count += 1
+            labels_by_field = info.get("labels_by_field", {})
+            if not labels_by_field:
+                continue
+
+            # a series counts once per label, no matter how many volumes carry it
+            entry = book_id
+            for k in ('series', 'series_name', 'series_title'):
+                s = info.get(k)
+                if s:
+                    series_name = str(s).strip().lower()
+                    # "standalone novels" is not a real series: count those books individually
+                    if series_name != "standalone novels":
+                        entry = ("series", series_name)
+                    break
+
+            for field, label_values in labels_by_field.items():
+                presence = self._presence.setdefault(field, set())
+                field_entries = entries.setdefault(field, {})
+                for raw_lbl in label_values:
+                    key = raw_lbl.strip().lower()
+                    presence.add(key)
+                    if key:
+                        field_entries.setdefault(key, set()).add(entry)
+
+        self._counts = {
+            field: {key: len(members) for key, members in field_entries.items()}
+            for field, field_entries in entries.items()
+        }
+
+    def to_state(self):
+        """JSON-friendly form, used to send a snapshot over the engine daemon's socket."""
+        return {
+            "book_count": self.book_count,
+            "presence": {field: sorted(keys) for field, keys in self._presence.items()},
+            "counts": self._counts
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        snapshot = cls.__new__(cls)
+        snapshot.book_count = state["book_count"]
+        snapshot._presence = {field: set(keys) for field, keys in state["presence"].items()}
+        snapshot._counts = state["counts"]
+        return snapshot
+
+    def labels(self, field):
+        """Lowercase labels of field that occur in at least one book."""
+        return self._presence.get(field, set())
+
+    def counts(self, field, refinement=None):
+        """
+        label (lowercase) -> count for field. Counts from the query's refinement
+        take precedence; labels it doesn't mention use the snapshot's counts.
+        """
+        counts = {}
+        if refinement and field in refinement:
+            try:
+                for lbl, cnt in refinement.get(field, []):
+                    counts[lbl.lower()] = int(cnt)
+            except Exception:
+                pass  # defensive
+        for key, count in self._counts.get(field, {}).items():
+            counts.setdefault(key, count)
+        return counts
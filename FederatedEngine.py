@@ -0,0 +1,235 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+from multiprocessing.connection import Pipe
+from CalibreEngine import CalibreEngine, export_version
+from FacetSnapshot import FacetSnapshot
+
+LIBRARIES_FILE = "libraries.json"
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.realpath(__file__)), "LibraryWorker.py")
+
+
+def read_libraries(library_dir):
+    """
+    {name: export directory} from library_dir/libraries.json, or None when
+    there is no such file. Relative directories are resolved against library_dir.
+    """
+    path = os.path.join(library_dir, LIBRARIES_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        libraries = json.load(f)
+    for name in libraries:
+        if not name or ":" in name:
+            raise ValueError(f"{path}: library name {name!r} must be non-empty and contain no ':'")
+    return {name: os.path.join(library_dir, directory) for name, directory in libraries.items()}
+
+
+class FederatedLabelMap:
+    """Read-only label_map over all libraries, keyed by "library:book_id"; records are fetched on first use."""
+
+    def __init__(self, engine, book_count):
+        self._engine = engine
+        self._book_count = book_count
+        self._books = {}
+        self._missing = set()
+
+    def load(self, book_ids):
+        wanted = [book_id for book_id in book_ids if book_id not in self._books and book_id not in self._missing]
+        if not wanted:
+            return
+        by_library = self._engine.split_ids(wanted)
+        for found in self._engine.broadcast("books", {name: {"book_ids": ids} for name, ids in by_library.items()}).values():
+            self._books.update(found)
+        self._missing.update(book_id for book_id in wanted if book_id not in self._books)
+
+    def get(self, book_id, default=None):
+        if book_id not in self._books and book_id not in self._missing:
+            self.load([book_id])
+        return self._books.get(book_id, default)
+
+    def __getitem__(self, book_id):
+        info = self.get(book_id)
+        if info is None:
+            raise KeyError(book_id)
+        return info
+
+    def __contains__(self, book_id):
+        return self.get(book_id) is not None
+
+    def __len__(self):
+        return self._book_count
+
+
+class FederatedLabelToBooks:
+    """Read-only label_to_books over all libraries: the union of every library's posting."""
+
+    def __init__(self, engine):
+        self._engine = engine
+        self._postings = {}
+
+    def get(self, key, default=None):
+        if key not in self._postings:
+            replies = self._engine.broadcast("label_books", {name: {"keys": [key]} for name in self._engine.libraries})
+            self._postings[key] = set().union(*(books for (books,) in replies.values()))
+        return self._postings[key] or default
+
+
+class FederatedEngine(CalibreEngine):
+    """
+    Several library exports mounted as one engine.
+
+    Every library gets a worker process holding its own CalibreEngine, so a
+    selection is evaluated in all libraries in parallel and answering costs
+    about as much as the slowest library. Book ids are "library:book_id" and
+    every book record carries "library". Refinement counts are merged from the
+    libraries' per-label series / book sets before filtering, so they match
+    what one engine over the combined export would report; facet snapshots add
+    up per-library counts (a series split across libraries counts once in each).
+
+    Label groups belong to the federation and live in label_groups_path.
+    """
+
+    def __init__(self, libraries, label_groups_path="label_groups.json"):
+        self.libraries = dict(libraries)
+        self.version = self._export_versions()
+        self.label_groups_path = label_groups_path
+        try:
+            with open(label_groups_path, "r", encoding="utf-8") as f:
+                self.label_groups = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.label_groups = {}
+
+        # A fresh interpreter per worker running LibraryWorker.py: not fork, as
+        # the TUI has threads running when the engine loads, and not
+        # multiprocessing's spawn, which re-imports the parent's __main__
+        self._lock = threading.Lock()  # one request in flight per worker pipe
+        self._workers = {}
+        for name, library_dir in self.libraries.items():
+            parent_conn, child_conn = Pipe()
+            process = subprocess.Popen(
+                [sys.executable, WORKER_SCRIPT, name, library_dir, str(child_conn.fileno())],
+                stdin=subprocess.DEVNULL, pass_fds=(child_conn.fileno(),)
+            )
+            child_conn.close()
+            self._workers[name] = (process, parent_conn)
+
+        # libraries load in parallel; the vocabularies are merged as they report in
+        self.dynamic_vocab = {}
+        self.parser = {}
+        book_count = 0
+        for name, info in self._collect().items():
+            book_count += info["book_count"]
+            for field, labels in info["dynamic_vocab"].items():
+                self.dynamic_vocab[field] = sorted(set(self.dynamic_vocab.get(field, [])) | set(labels))
+            for field, mapping in info["parser"].items():
+                self.parser.setdefault(field, mapping)
+
+        self.label_map = FederatedLabelMap(self, book_count)
+        self.label_to_books = FederatedLabelToBooks(self)
+        self.normalized_parser_labels = self._build_normalized_parser_labels()
+        self.label_to_category = self._build_reverse_label_lookup()
+        self._build_group_member_lookup()
+
+    def _export_versions(self):
+        return [export_version(library_dir) for library_dir in self.libraries.values()]
+
+    def is_stale(self):
+        return self._export_versions() != self.version
+
+    def split_ids(self, book_ids):
+        """{library: [its own book ids]} for "library:book_id" ids."""
+        by_library = {}
+        for book_id in book_ids:
+            name, _, own_id = book_id.partition(":")
+            if name in self._workers:
+                by_library.setdefault(name, []).append(own_id)
+        return by_library
+
+    def broadcast(self, op, args_by_library):
+        """Send op to the given libraries at once, then gather {library: reply}."""
+        with self._lock:
+            for name, args in args_by_library.items():
+                self._workers[name][1].send((op, args))
+            return self._collect(args_by_library)
+
+    def _collect(self, names=None):
+        replies = {}
+        errors = []
+        for name in (self._workers if names is None else names):
+            try:
+                status, reply = self._workers[name][1].recv()
+            except EOFError:
+                status, reply = "error", "worker process exited"
+            if status == "ok":
+                replies[name] = reply
+            else:
+                errors.append(f"{name}: {reply}")
+        if errors:
+            raise RuntimeError("library worker failed — " + "; ".join(errors))
+        return replies
+
+    def query(self, input_labels, cancel_event=None):
+        if not isinstance(input_labels, dict):
+            raise TypeError("FederatedEngine only supports field-aware queries ({field: [labels]})")
+        results = self.query_batch([input_labels], cancel_event)
+        return None if results is None else results[0]
+
+    def query_batch(self, selections, cancel_event=None):
+        replies = self.broadcast("query_parts", {name: {"selections": selections} for name in self.libraries})
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+
+        batch_results = []
+        for position in range(len(selections)):
+            results = {}
+            include_labels = set()
+            entries = {}
+            for name in self.libraries:  # library order, then each library's own order
+                books, library_labels, library_entries = replies[name][position]
+                results.update(books)
+                include_labels |= library_labels
+                for field, labels in library_entries.items():
+                    merged = entries.setdefault(field, {})
+                    for label, keys in labels.items():
+                        merged.setdefault(label, set()).update(keys)
+            if not include_labels:
+                batch_results.append({"books": {}, "refinable_labels": {}, "query_labels": [], "refinement_closed": True})
+                continue
+            batch_results.append(self._summary(results, include_labels, entries))
+        return batch_results
+
+    def facet_snapshot(self, book_ids=None):
+        if book_ids is None:
+            args_by_library = {name: {"book_ids": None} for name in self.libraries}
+        else:
+            args_by_library = {name: {"book_ids": ids} for name, ids in self.split_ids(book_ids).items()}
+        merged = {"book_count": 0, "presence": {}, "counts": {}}
+        for state in self.broadcast("facets", args_by_library).values():
+            merged["book_count"] += state["book_count"]
+            for field, keys in state["presence"].items():
+                merged["presence"].setdefault(field, set()).update(keys)
+            for field, counts in state["counts"].items():
+                field_counts = merged["counts"].setdefault(field, {})
+                for key, count in counts.items():
+                    field_counts[key] = field_counts.get(key, 0) + count
+        return FacetSnapshot.from_state(merged)
+
+    def preload_books(self, book_ids):
+        self.label_map.load(book_ids)
+
+    def close(self):
+        with self._lock:
+            for process, conn in self._workers.values():
+                try:
+                    conn.send(None)
+                except OSError:
+                    pass
+            for process, conn in self._workers.values():
+                try:
+                    process.wait(timeout=2)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                conn.close()
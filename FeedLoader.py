@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+import time
+# feedparser, urllib.request and concurrent.futures are imported on first use:
+# together they are a noticeable part of startup, and feeds load after the first frame
+
+DEFAULT_TIMEOUT = 10  # seconds per feed, connect + download
+READ_CHUNK = 64 * 1024
+DEFAULT_CACHE_TTL = 30 * 60  # seconds a cached feed is shown without asking the server
+
+
+class FeedCache:
+    """
+    Parsed feeds on disk (one JSON document), each with the ETag / Last-Modified
+    validators of the response it came from and the time it was last confirmed.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.feeds = {}  # url -> {"entries", "etag", "modified", "fetched"}
+        self.dirty = False
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.feeds = json.load(f)
+            except Exception as e:
+                print(f"⚠️ Failed to load feed cache: {e}")
+
+    def get(self, url):
+        return self.feeds.get(url)
+
+    def is_fresh(self, url):
+        cached = self.feeds.get(url)
+        return cached is not None and time.time() - cached.get("fetched", 0) < self.ttl
+
+    def put(self, url, entries, etag=None, modified=None):
+        self.feeds[url] = {"entries": entries, "etag": etag, "modified": modified, "fetched": time.time()}
+        self.dirty = True
+
+    def touch(self, url):
+        """The server confirmed the cached copy (304 Not Modified)."""
+        self.feeds[url]["fetched"] = time.time()
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.feeds, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+        except Exception as e:
+            print(f"⚠️ Failed to save feed cache: {e}")
+
+
+class FeedLoader:
+    """
+    Fetches the Book Feeds pane's RSS feeds concurrently, off the UI thread.
+
+    Every feed is downloaded on a pool thread with its own deadline and parsed
+    there; on_feed(url, entries, error) is then called on the urwid loop (via a
+    pipe registered with MainLoop.watch_pipe) as each feed finishes, so the pane
+    fills in feed by feed and a slow or dead feed never blocks the UI.
+    entries is a list of {"title", "summary", "link"} dicts. Results of a round
+    that was superseded by start() or cancel() are dropped.
+
+    With a FeedCache, feeds still within its TTL aren't requested at all and
+    the others are revalidated with conditional GETs (If-None-Match /
+    If-Modified-Since), so an unchanged feed costs one 304. A feed that fails
+    to load falls back to its cached entries.
+    """
+
+    def __init__(self, loop, on_feed, timeout=DEFAULT_TIMEOUT, max_items=2, max_workers=5, cache=None):
+        self.loop = loop
+        self.cache = cache
+        self.on_feed = on_feed
+        self.timeout = timeout
+        self.max_items = max_items
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._finished = []  # (generation, url, entries, error), filled by pool threads
+        self.max_workers = max_workers
+        self._executor = None  # created by the first start()
+        self._pipe_fd = loop.watch_pipe(self._deliver)
+
+    def start(self, urls):
+        """Fetch every url that isn't fresh in the cache."""
+        self.cancel()
+        for url in urls:
+            if self.cache is not None and self.cache.is_fresh(url):
+                continue
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="feed")
+            self._executor.submit(self._fetch, self.generation, url)
+
+    def cached_entries(self, url):
+        """Entries last seen for url, or None (shown at startup before any network access)."""
+        if self.cache is None:
+            return None
+        with self._lock:
+            cached = self.cache.get(url)
+            return cached["entries"] if cached else None
+
+    def cancel(self):
+        self.generation += 1
+
+    def _fetch(self, generation, url):
+        with self._lock:
+            cached = self.cache.get(url) if self.cache is not None else None
+        entries = None
+        try:
+            response = self._download(url, cached)
+            if response is not None:
+                data, etag, modified = response
+                entries = self._parse(data)
+            error = None
+        except Exception as e:
+            response, error = None, str(e) or type(e).__name__
+
+        with self._lock:
+            if error:
+                entries = cached["entries"] if cached else []
+            elif response is None:
+                entries = cached["entries"]
+                self.cache.touch(url)
+            elif self.cache is not None:
+                self.cache.put(url, entries, etag, modified)
+            if generation != self.generation:
+                return
+            self._finished.append((generation, url, entries, error))
+        try:
+            os.write(self._pipe_fd, b"\n")
+        except OSError:
+            pass  # pipe closed on shutdown
+
+    def _download(self, url, cached=None):
+        """(body, etag, last_modified), or None if the server says cached is still current."""
+        import urllib.error
+        import urllib.request
+        import feedparser
+        # urlopen's timeout only bounds each socket operation; the deadline bounds the whole feed
+        deadline = time.monotonic() + self.timeout
+        headers = {"User-Agent": feedparser.USER_AGENT}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("modified"):
+                headers["If-Modified-Since"] = cached["modified"]
+        request = urllib.request.Request(url, headers=headers)
+        chunks = []
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                while True:
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"no complete response within {self.timeout}s")
+                    chunk = response.read(READ_CHUNK)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                etag = response.headers.get("ETag")
+                modified = response.headers.get("Last-Modified")
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and cached:
+                return None
+            raise
+        return b"".join(chunks), etag, modified
+
+    def _parse(self, data):
+        import feedparser
+        feed = feedparser.parse(data)
+        return [
+            {
+                "title": entry.get("title", ""),
+                "summary": entry.get("summary", ""),
+                "link": entry.get("link", "")
+            }
+            for entry in feed.entries[:self.max_items]
+        ]
+
+    def _deliver(self, data):
+        """Runs on the UI thread whenever a pool thread signalled the pipe."""
+        with self._lock:
+            finished, self._finished = self._finished, []
+            if self.cache is not None:
+                self.cache.save()
+        for generation, url, entries, error in finished:
+            if generation == self.generation:
+                self.on_feed(url, entries, error)
+        return True  # keep the pipe open
+
+    def close(self):
+        self.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        if self.cache is not None:
+            with self._lock:
+                self.cache.save()
+        self.loop.remove_watch_pipe(self._pipe_fd)  # closes the read end only
+        os.close(self._pipe_fd)
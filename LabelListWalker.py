@@ -0,0 +1,130 @@
+import urwid
+
+
+def row_key(row):
+    """Stable identity of a label pane row, used to diff successive row models."""
+    kind = row["kind"]
+    field = row.get("field")
+    if kind == "group":
+        return (kind, field, row["group"])
+    if kind == "member":
+        return (kind, field, row["group"], row["key"])
+    if kind == "label":
+        return (kind, field, row["key"])
+    if kind == "search_result":
+        return (kind, field, row["label"])
+    if kind == "message":
+        return (kind, field, row["text"])
+    return (kind, field)
+
+
+class LabelListWalker(urwid.ListWalker):
+    """
+    ListWalker for the Labels pane that builds row widgets on demand.
+
+    The pane is described by a list of lightweight row dicts (kind, field,
+    group, label, count, ...) produced by CalibreUI.build_label_list. Widgets
+    are created by make_widget(row) only when the ListBox asks for a position,
+    and only the rows within cache_radius of the focus keep their widgets, so
+    rebuilding the pane costs roughly one screenful of widgets no matter how
+    many fields and groups are expanded.
+
+    update_rows() applies a new row model as a diff against the current one:
+    unchanged rows keep their widgets, changed rows are patched in place via
+    update_widget(widget, old_row, new_row) when possible, and the focus
+    follows the focused row's key rather than its index.
+    """
+
+    def __init__(self, make_widget, update_widget=None, cache_radius=80):
+        self.make_widget = make_widget
+        self.update_widget = update_widget
+        self.cache_radius = cache_radius
+        self.rows = []
+        self.focus = 0
+        self._widgets = {}  # position -> widget built for rows[position]
+
+    def set_rows(self, rows, focus=None):
+        self.rows = rows
+        self._widgets = {}
+        self.focus = self._clamp(focus or 0)
+        self._modified()
+
+    def update_rows(self, rows):
+        old_rows = self.rows
+        old_positions = {row_key(row): position for position, row in enumerate(old_rows)}
+        new_positions = {}
+        widgets = {}
+        for position, row in enumerate(rows):
+            key = row_key(row)
+            new_positions[key] = position
+            old_position = old_positions.get(key)
+            if old_position is None:
+                continue
+            widget = self._widgets.get(old_position)
+            if widget is None:
+                continue
+            old_row = old_rows[old_position]
+            if old_row == row or (self.update_widget and self.update_widget(widget, old_row, row)):
+                widgets[position] = widget
+
+        # Keep the focus on the same row, or on the closest surviving row above it
+        focus = 0
+        for position in range(min(self.focus, len(old_rows) - 1), -1, -1):
+            key = row_key(old_rows[position])
+            if key in new_positions:
+                focus = new_positions[key]
+                break
+
+        self.rows = rows
+        self._widgets = widgets
+        self.focus = self._clamp(focus)
+        self._modified()
+
+    @property
+    def focus_row(self):
+        if not self.rows:
+            return None
+        return self.rows[self.focus]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, position):
+        if not isinstance(position, int) or not 0 <= position < len(self.rows):
+            raise IndexError(position)
+        widget = self._widgets.get(position)
+        if widget is None:
+            widget = self.make_widget(self.rows[position])
+            self._widgets[position] = widget
+            if len(self._widgets) > 2 * self.cache_radius:
+                self._trim()
+        return widget
+
+    def next_position(self, position):
+        if position + 1 >= len(self.rows):
+            raise IndexError(position)
+        return position + 1
+
+    def prev_position(self, position):
+        if position <= 0:
+            raise IndexError(position)
+        return position - 1
+
+    def set_focus(self, position):
+        if not 0 <= position < len(self.rows):
+            raise IndexError(position)
+        self.focus = position
+        self._modified()
+
+    def positions(self, reverse=False):
+        if reverse:
+            return range(len(self.rows) - 1, -1, -1)
+        return range(len(self.rows))
+
+    def _clamp(self, position):
+        return max(0, min(position, len(self.rows) - 1))
+
+    def _trim(self):
+        """Drop widgets of rows far away from the focus; they are rebuilt if scrolled back to."""
+        for position in [p for p in self._widgets if abs(p - self.focus) > self.cache_radius]:
+            del self._widgets[position]
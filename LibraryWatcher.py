@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Watch mode: re-exports the library whenever Calibre changes metadata.db.
+
+    python3 LibraryWatcher.py --db "/path/to/Calibre Library/metadata.db"
+    python3 LibraryWatcher.py --db ... --output-dir exports/manga --debounce 10
+
+metadata.db is polled every --interval seconds: SQLite's PRAGMA data_version
+(which changes whenever another connection commits) plus the mtimes of the
+database and its -wal file. A burst of edits is exported once, after
+--debounce quiet seconds (or --max-wait seconds into a burst that doesn't
+stop). Each export runs Semantic_Compatibility_Matrix_Builder.py --incremental,
+which only re-reads the books Calibre modified (--full rebuilds everything);
+afterwards an EngineDaemon.py daemon serving the export is told to reload. Open TUI
+sessions notice the new export (or the daemon's reload) on their own and
+reload in the background.
+"""
+import argparse
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from ExportWriter import FORMATS
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+BUILDER = os.path.join(SCRIPT_DIR, "Semantic_Compatibility_Matrix_Builder.py")
+
+
+class LibraryWatcher:
+    """Polls a Calibre metadata.db and reports each burst of committed changes once."""
+
+    def __init__(self, db_path, interval=2.0, debounce=5.0, max_wait=60.0):
+        self.db_path = db_path
+        self.interval = interval
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self._conn = None
+
+    def _data_version(self):
+        # data_version only moves for commits made by *other* connections,
+        # so the watcher keeps one read-only connection open for its lifetime
+        try:
+            if self._conn is None:
+                self._conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None  # e.g. the file was replaced; reconnect next time
+            return None
+
+    def _mtime(self, path):
+        try:
+            stat = os.stat(path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def signature(self):
+        return (self._data_version(), self._mtime(self.db_path), self._mtime(self.db_path + "-wal"))
+
+    def changes(self):
+        """Yields once per debounced burst of changes; never returns."""
+        last = self.signature()
+        burst_started = None
+        last_change = None
+        while True:
+            time.sleep(self.interval)
+            current = self.signature()
+            now = time.monotonic()
+            if current != last:
+                last = current
+                last_change = now
+                if burst_started is None:
+                    burst_started = now
+            if burst_started is None:
+                continue
+            if now - last_change >= self.debounce or now - burst_started >= self.max_wait:
+                burst_started = None
+                yield
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def export(db_path, output_dir, verbose=False, incremental=True, fmt="json"):
+    """Run the builder for one library; returns True on success."""
+    command = [sys.executable, BUILDER, "--db", db_path, "--output-dir", output_dir, "--format", fmt]
+    if incremental:
+        command.append("--incremental")
+    started = time.perf_counter()
+    result = subprocess.run(command, stdout=None if verbose else subprocess.DEVNULL)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        print(f"❌ Export failed (exit code {result.returncode}) after {elapsed:.1f}s", file=sys.stderr)
+        return False
+    print(f"✅ Exported to {output_dir} in {elapsed:.1f}s", file=sys.stderr)
+    return True
+
+
+def notify_daemon(socket_path):
+    """Ask a running engine daemon to reload now instead of at its next export check."""
+    from EngineDaemon import send_request
+    if not os.path.exists(socket_path):
+        return
+    try:
+        generation = send_request(socket_path, "reload")
+        print(f"🔄 Engine daemon reloaded (generation {generation})", file=sys.stderr)
+    except (OSError, RuntimeError) as e:
+        print(f"⚠️ Engine daemon not reloaded: {e}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-export the library whenever Calibre changes metadata.db.")
+    parser.add_argument("--db", default=os.environ.get("CALIBRE_DB_PATH"),
+                        help="Calibre metadata.db to watch (default: $CALIBRE_DB_PATH)")
+    parser.add_argument("--output-dir", default=SCRIPT_DIR,
+                        help="export directory passed to the builder (default: next to this script)")
+    parser.add_argument("--socket", default=None,
+                        help="engine daemon socket to notify (default: calibre_engine.sock in the output directory)")
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between polls (default: 2)")
+    parser.add_argument("--debounce", type=float, default=5.0,
+                        help="quiet seconds that end a burst of changes (default: 5)")
+    parser.add_argument("--max-wait", type=float, default=60.0,
+                        help="export at the latest this many seconds into a burst (default: 60)")
+    parser.add_argument("--full", action="store_true",
+                        help="rebuild the whole export every time instead of patching it")
+    parser.add_argument("--format", choices=FORMATS, default="json",
+                        help="export file format passed to the builder (default: json)")
+    parser.add_argument("--verbose", action="store_true", help="show the builder's output")
+    args = parser.parse_args(argv)
+    if not args.db:
+        parser.error("pass --db or set CALIBRE_DB_PATH")
+
+    from EngineDaemon import default_socket_path
+    socket_path = args.socket or default_socket_path(args.output_dir)
+    watcher = LibraryWatcher(args.db, interval=args.interval, debounce=args.debounce, max_wait=args.max_wait)
+    print(f"👀 Watching {args.db}", file=sys.stderr)
+    try:
+        for _ in watcher.changes():
+            print("📝 Library changed, exporting…", file=sys.stderr)
+            if export(args.db, args.output_dir, verbose=args.verbose, incremental=not args.full, fmt=args.format):
+                notify_daemon(socket_path)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Worker process of a FederatedEngine: owns one library's CalibreEngine and
+answers the parent's requests over the connection it inherits.
+
+    python3 LibraryWorker.py NAME LIBRARY_DIR FD
+
+FederatedEngine starts it as a program of its own rather than as a
+multiprocessing child, which would re-run the parent's __main__ module (the
+whole TUI setup) in every worker; this one only imports the engine.
+"""
+import signal
+import sys
+from multiprocessing.connection import Connection
+from EngineDaemon import load_single_engine
+
+
+def serve(name, library_dir, conn):
+    try:
+        engine = load_single_engine(library_dir)
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+        return
+    conn.send(("ok", {
+        "book_count": len(engine.label_map),
+        "dynamic_vocab": engine.dynamic_vocab,
+        "parser": engine.parser
+    }))
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return  # the parent is gone
+        if request is None:
+            return
+        op, args = request
+        try:
+            if op == "query_parts":
+                reply = engine.query_parts(args["selections"], tag=name)
+            elif op == "facets":
+                reply = engine.facet_snapshot(args["book_ids"]).to_state()
+            elif op == "books":
+                label_map = engine.label_map
+                reply = {
+                    f"{name}:{book_id}": dict(label_map[book_id], library=name)
+                    for book_id in args["book_ids"] if book_id in label_map
+                }
+            elif op == "label_books":
+                reply = [
+                    {f"{name}:{book_id}" for book_id in engine.label_to_books.get(key, ())}
+                    for key in args["keys"]
+                ]
+            else:
+                raise ValueError(f"unknown op {op!r}")
+            conn.send(("ok", reply))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+if __name__ == "__main__":
+    # Ctrl+C is the parent's to handle; it then closes the connection
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    name, library_dir, fd = sys.argv[1:]
+    serve(name, library_dir, Connection(int(fd)))
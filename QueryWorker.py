@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+
+
+class QueryWorker:
+    """
+    Runs engine.query for the Titles pane off the UI thread.
+
+    Every submit() starts a new generation and cancels the query still running
+    for the previous one (engine.query checks the cancel event while it scans).
+    A finished result is stored in ComboUsageTracker, even if its selection
+    was superseded after the scan completed, then handed back to the urwid
+    loop through a pipe registered with MainLoop.watch_pipe; on_result is only
+    called for the current generation, so results of superseded selections
+    are not shown even if they finished before they could be cancelled.
+    """
+
+    def __init__(self, engine, usage_tracker, loop, on_result):
+        self.engine = engine
+        self.usage_tracker = usage_tracker
+        self.loop = loop
+        self.on_result = on_result
+        self.generation = 0
+        self._cancel_event = None
+        self._lock = threading.Lock()
+        self._finished = {}  # generation -> (combo_key, result), filled by worker threads
+        self._pipe_fd = loop.watch_pipe(self._deliver)
+
+    def submit(self, combo_key, labels_by_field):
+        """Query labels_by_field ({field: [labels]}) in the background; returns the generation."""
+        self.discard()
+        cancel_event = threading.Event()
+        self._cancel_event = cancel_event
+        # the engine and library generation of this moment, in case the library is reloaded meanwhile
+        data = (self.engine, self.usage_tracker.generation)
+        threading.Thread(
+            target=self._run,
+            args=(self.generation, combo_key, labels_by_field, cancel_event, data),
+            name="titles-query",
+            daemon=True
+        ).start()
+        return self.generation
+
+    def discard(self):
+        """Cancel the running query and ignore anything still in flight."""
+        if self._cancel_event is not None:
+            self._cancel_event.set()
+            self._cancel_event = None
+        self.generation += 1
+
+    @property
+    def pending(self):
+        """True while the current generation's result hasn't been delivered."""
+        return self._cancel_event is not None
+
+    def _run(self, generation, combo_key, labels_by_field, cancel_event, data):
+        engine, data_generation = data
+        try:
+            started = time.perf_counter()
+            result = engine.query(labels_by_field, cancel_event=cancel_event)
+            cost_ms = (time.perf_counter() - started) * 1000
+        except Exception as e:
+            print(f"⚠️ Query failed: {e}")
+            result = None  # delivered as None so the UI stops waiting
+        else:
+            if result is None:
+                return  # cancelled mid-scan
+            # a result that finished before the cancel was noticed is complete:
+            # cache it even though its selection has been superseded
+            self.usage_tracker.store(combo_key, result, cost_ms=cost_ms, generation=data_generation)
+            if cancel_event.is_set():
+                return
+        with self._lock:
+            self._finished[generation] = (combo_key, result)
+        try:
+            os.write(self._pipe_fd, b"\n")
+        except OSError:
+            pass  # pipe closed on shutdown
+
+    def _deliver(self, data):
+        """Runs on the UI thread whenever a worker signalled the pipe."""
+        with self._lock:
+            finished, self._finished = self._finished, {}
+        item = finished.get(self.generation)
+        if item is not None:
+            self._cancel_event = None
+            self.on_result(*item)
+        return True  # keep the pipe open
+
+    def close(self):
+        self.discard()
+        self.loop.remove_watch_pipe(self._pipe_fd)  # closes the read end only
+        os.close(self._pipe_fd)
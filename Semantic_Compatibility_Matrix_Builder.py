@@ -1,18 +1,57 @@
 import os
+import re
 import json
 import sqlite3
+import hashlib
+import argparse
+import multiprocessing
 from collections import defaultdict
+from ExportWriter import FORMATS, ExportWriter, iter_export, read_export
 
 # === CONFIGURATION ===
 CALIBRE_DB_PATH = "/srv/dev-disk-by-uuid-2856cdb9-5991-47dc-886b-1be20f8c2993/ArkVault/Calibre Library/metadata.db"
 
 # Use relative paths for portability
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-OUTPUT_LABEL_MAP = os.path.join(SCRIPT_DIR, "semantic_label_map.json")
-DYNAMIC_VOCAB_PATH = os.path.join(SCRIPT_DIR, "dynamic_vocabulary.json")
-VOCABULARY_PARSER_PATH = os.path.join(SCRIPT_DIR, "vocabulary_parser.json")
-FREQUENCY_MAP_PATH = os.path.join(SCRIPT_DIR, "label_frequency.json")
-FLAT_INDEX_PATH = os.path.join(SCRIPT_DIR, "flat_label_index.json")
+
+# One export per Calibre library: --db / --output-dir point the builder at
+# another library, e.g. one of the directories listed in libraries.json
+arg_parser = argparse.ArgumentParser(description="Export Calibre metadata for CalSynTUI+.")
+arg_parser.add_argument("--db", default=os.environ.get("CALIBRE_DB_PATH", CALIBRE_DB_PATH),
+                        help="Calibre metadata.db (default: $CALIBRE_DB_PATH or the path configured above)")
+arg_parser.add_argument("--output-dir", default=SCRIPT_DIR,
+                        help="directory the JSON files are written to (default: next to this script)")
+arg_parser.add_argument("--incremental", action="store_true",
+                        help="patch the previous export in --output-dir with only the books added, changed or "
+                             "deleted since (falls back to a full export when it can't)")
+arg_parser.add_argument("--format", choices=FORMATS, default="json",
+                        help="json: indented (default); compact: no whitespace; binary: zlib-compressed compact JSON. "
+                             "The engine reads all three")
+arg_parser.add_argument("--jobs", type=int, default=1,
+                        help="processes labelling books in parallel (default: 1; 0 = auto, one per CPU)")
+args = arg_parser.parse_args()
+if args.jobs < 0:
+    arg_parser.error(f"--jobs must be 0 (auto) or a positive number, not {args.jobs}")
+CALIBRE_DB_PATH = args.db
+OUTPUT_DIR = args.output_dir
+os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+OUTPUT_LABEL_MAP = os.path.join(OUTPUT_DIR, "semantic_label_map.json")
+DYNAMIC_VOCAB_PATH = os.path.join(OUTPUT_DIR, "dynamic_vocabulary.json")
+# a library may bring its own parser; otherwise the one next to this script is used
+VOCABULARY_PARSER_PATH = os.path.join(OUTPUT_DIR, "vocabulary_parser.json")
+if not os.path.exists(VOCABULARY_PARSER_PATH):
+    VOCABULARY_PARSER_PATH = os.path.join(SCRIPT_DIR, "vocabulary_parser.json")
+FREQUENCY_MAP_PATH = os.path.join(OUTPUT_DIR, "label_frequency.json")
+FLAT_INDEX_PATH = os.path.join(OUTPUT_DIR, "flat_label_index.json")
+FINGERPRINTS_PATH = os.path.join(OUTPUT_DIR, "label_fingerprints.json")
+EXPORT_STATE_PATH = os.path.join(OUTPUT_DIR, "export_state.json")
+EXPORT_STATE_VERSION = 1
+OUTPUT_FORMAT = args.format
+JOBS = args.jobs or os.cpu_count() or 1  # 0: auto
+# Books read and labelled at a time: bounds the memory the bulk reads take,
+# and is the unit of work handed to --jobs workers
+SHARD_BOOKS = 2000
 
 # === ALLOWED FIELDS ===
 ALLOWED_FIELDS = {
@@ -26,10 +65,11 @@ ALLOWED_FIELDS = {
 CORE_FIELDS = {"series"}
 
 # === INIT RESULT MAPS ===
-label_map = {}
+previous_records = iter(())  # (book id, record) of the previous export, when patching it
 dynamic_vocab = defaultdict(set)
 label_frequency = defaultdict(int)
 flat_label_index = defaultdict(list)
+occurrences = {}  # book id -> [(field, label), ...] of the previous export, see label_book()
 
 # === LOAD VOCABULARY PARSER ===
 try:
@@ -43,11 +83,47 @@ except Exception as e:
 # === CONNECT TO CALIBRE DATABASE ===
 conn = sqlite3.connect(CALIBRE_DB_PATH)
 cursor = conn.cursor()
+# One read snapshot for the whole export, so the last_modified high-water
+# mark recorded below matches the rows that were read
+conn.execute("BEGIN")
+
+# === HELPER: Introspect the schema once ===
+cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+existing_tables = {row[0] for row in cursor.fetchall()}
 
-# === HELPER: Check if table exists ===
 def table_exists(cursor, table_name):
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-    return cursor.fetchone() is not None
+    return table_name in existing_tables
+
+# === HELPER: Read a link table for all books at once ===
+def per_book_order(cursor, lookup_sql):
+    """
+    ORDER BY terms (after l.book) that return each book's rows in the order a
+    per-book lookup (lookup_sql, filtering on l.book = ?) returns them: the
+    order of the index SQLite picks for that lookup, or rowid order when it
+    scans. Keeps the bulk read's output identical to per-book queries.
+    """
+    cursor.execute("EXPLAIN QUERY PLAN " + lookup_sql, (0,))
+    for row in cursor.fetchall():
+        match = re.search(r"\bl USING (?:COVERING )?INDEX (\S+)", row[-1])
+        if match:
+            cursor.execute(f"PRAGMA index_info('{match.group(1)}')")
+            columns = [name for _, _, name in sorted(cursor.fetchall())]
+            return [f"l.{name}" for name in columns if name != "book"] + ["l.rowid"]
+    return ["l.rowid"]
+
+def read_per_book(cursor, select, from_join):
+    """
+    {book id: [value, ...]} for the books in temp.export_books in one query:
+    "SELECT l.book, <select> FROM <from_join>", grouped in Python with rows
+    in per-book lookup order.
+    """
+    order = per_book_order(cursor, f"SELECT {select} FROM {from_join} WHERE l.book = ?")
+    cursor.execute(f"SELECT l.book, {select} FROM {from_join} "
+                   f"WHERE l.book IN (SELECT id FROM temp.export_books) ORDER BY l.book, {', '.join(order)}")
+    values_by_book = defaultdict(list)
+    for book, value in cursor.fetchall():
+        values_by_book[book].append(value)
+    return values_by_book
 
 # === DISCOVER CUSTOM COLUMNS ===
 cursor.execute("SELECT id, name FROM custom_columns")
@@ -62,48 +138,137 @@ for col_id, name in raw_columns:
 print(f"🧠 Using filtered custom fields: {list(field_map.keys())}")
 print(f"🧠 Including core fields: {list(CORE_FIELDS & ALLOWED_FIELDS)}\n")
 
+# === EXPORT SETTINGS ===
+# A previous export can only be patched if it was built from the same
+# database with the same vocabulary parser and fields
+settings_hash = hashlib.sha1(json.dumps(
+    {"parser": vocabulary_parser, "fields": field_map, "allowed": sorted(ALLOWED_FIELDS)},
+    sort_keys=True, ensure_ascii=False
+).encode("utf-8")).hexdigest()[:16]
+
+# field -> (value table, value column, link table, link column)
+value_tables = {}
+if "series" in ALLOWED_FIELDS:
+    value_tables["series"] = ("series", "name", "books_series_link", "series")
+for field_name, col_index in field_map.items():
+    link_table = f"books_custom_column_{col_index}_link"
+    value_table = f"custom_column_{col_index}"
+    if table_exists(cursor, link_table) and table_exists(cursor, value_table):
+        value_tables[field_name] = (value_table, "value", link_table, "value")
+
+# Every value by id: renaming a series or custom value in Calibre doesn't
+# touch the last_modified of its books, so renames are found by comparison
+value_snapshot = {}
+for field_name, (value_table, value_column, _, _) in value_tables.items():
+    cursor.execute(f"SELECT id, {value_column} FROM {value_table}")
+    value_snapshot[field_name] = {str(value_id): value for value_id, value in cursor.fetchall()}
+
+def load_export_state():
+    """The previous export's state if it can be patched, else None."""
+    try:
+        state = read_export(EXPORT_STATE_PATH)
+        if not os.path.exists(OUTPUT_LABEL_MAP):
+            raise FileNotFoundError(OUTPUT_LABEL_MAP)
+    except FileNotFoundError:
+        print("ℹ️ No previous export to patch, running a full export\n")
+        return None
+    except Exception as e:
+        print(f"⚠️ Previous export unreadable ({e}), running a full export\n")
+        return None
+    if (state.get("version"), state.get("db"), state.get("settings")) != (
+            EXPORT_STATE_VERSION, os.path.abspath(CALIBRE_DB_PATH), settings_hash):
+        print("ℹ️ Database, vocabulary parser or fields changed since the previous export, running a full export\n")
+        return None
+    return state
+
 # === FETCH BOOKS ===
-cursor.execute("""
-    SELECT b.id, b.title, b.path, c.text
-    FROM books b
-    LEFT JOIN comments c ON b.id = c.book
-""")
-books = cursor.fetchall()
-print(f"🔍 Scanning {len(books)} books...\n")
-
-for idx, (book_id, title, path, comments) in enumerate(books, start=1):
+cursor.execute("SELECT MAX(last_modified) FROM books")
+high_water_mark = cursor.fetchone()[0]
+cursor.execute("SELECT id FROM books ORDER BY id")
+all_book_ids = [row[0] for row in cursor.fetchall()]
+
+previous = load_export_state() if args.incremental else None
+if previous is not None:
+    # Only books added or modified since the previous export (or carrying a
+    # renamed value) are read again; deleted books are dropped
+    # the previous label map is read back as it is merged, see PREVIOUS RECORDS
+    previous_records = iter_export(OUTPUT_LABEL_MAP)
+    occurrences = previous["occurrences"]
+    known_ids = set(previous["book_ids"])
+    deleted_ids = known_ids - set(all_book_ids)
+    cursor.execute("SELECT id FROM books WHERE last_modified > ?", (previous["last_modified"],))
+    selected_ids = {row[0] for row in cursor.fetchall()} | (set(all_book_ids) - known_ids)
+    for field_name, (_, _, link_table, link_column) in value_tables.items():
+        old_values = previous["values"].get(field_name, {})
+        renamed = [int(value_id) for value_id, value in value_snapshot[field_name].items()
+                   if value_id in old_values and old_values[value_id] != value]
+        if renamed:
+            cursor.execute(f"SELECT DISTINCT book FROM {link_table} WHERE {link_column} IN ({', '.join('?' * len(renamed))})", renamed)
+            selected_ids.update(row[0] for row in cursor.fetchall())
+
+    for book_id in deleted_ids:
+        occurrences.pop(str(book_id), None)
+    selected_ids = sorted(selected_ids)
+    print(f"🔁 Patching the previous export: {len(selected_ids)} new or changed books, {len(deleted_ids)} deleted\n")
+else:
+    selected_ids = all_book_ids
+
+# === READ BOOKS ===
+def read_books(cursor, book_ids):
+    """
+    Rows (id, title, path, comments) in id order, series names and raw custom
+    field values by book, for book_ids.
+    """
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS export_books (id INTEGER PRIMARY KEY)")
+    cursor.execute("DELETE FROM temp.export_books")
+    cursor.executemany("INSERT INTO temp.export_books VALUES (?)", ((book_id,) for book_id in book_ids))
+    cursor.execute("""
+        SELECT b.id, b.title, b.path, c.text
+        FROM books b
+        LEFT JOIN comments c ON b.id = c.book
+        WHERE b.id IN (SELECT id FROM temp.export_books)
+        ORDER BY b.id
+    """)
+    books = cursor.fetchall()
+
+    # One query per table instead of one per book and field
+    series_by_book = {}
+    field_values = {}  # field name -> {book id: [raw values]}
+    for field_name, (value_table, value_column, link_table, link_column) in value_tables.items():
+        try:
+            values_by_book = read_per_book(cursor, f"cc.{value_column}",
+                                           f"{link_table} l JOIN {value_table} cc ON l.{link_column} = cc.id")
+        except Exception as e:
+            print(f"⚠️ Skipping field {field_name}: {e}")
+            continue
+        if field_name == "series":
+            series_by_book = values_by_book
+        else:
+            field_values[field_name] = values_by_book
+    return books, series_by_book, field_values
+
+# === LABEL ONE BOOK ===
+def label_book(book_id, title, path, comments, series_by_book, field_values):
+    """
+    The book's label_map record (None if it has no labels) and its label
+    occurrences: one (field, label) per value, in the order they count
+    towards dynamic_vocab, label_frequency and flat_label_index.
+    """
     book_labels = {}
+    book_occurrences = []
     author_folder = path.split(os.sep)[0]
     series_name = None
     book_description = comments if comments else ""  # Store description/comments
 
-    # === Fetch Series Name ===
+    # === Series Name ===
     if "series" in ALLOWED_FIELDS:
-        cursor.execute("""
-            SELECT s.name
-            FROM books_series_link l
-            JOIN series s ON l.series = s.id
-            WHERE l.book = ?
-        """, (book_id,))
-        result = cursor.fetchone()
+        result = series_by_book.get(book_id)
         series_name = result[0] if result else None
 
-    # === Fetch Custom Field Labels ===
-    for field_name, col_index in field_map.items():
-        link_table = f"books_custom_column_{col_index}_link"
-        value_table = f"custom_column_{col_index}"
-
-        if not table_exists(cursor, link_table) or not table_exists(cursor, value_table):
-            continue
-
+    # === Custom Field Labels ===
+    for field_name, values_by_book in field_values.items():
         try:
-            cursor.execute(f"""
-                SELECT cc.value
-                FROM {link_table} l
-                JOIN {value_table} cc ON l.value = cc.id
-                WHERE l.book = ?
-            """, (book_id,))
-            values = [row[0].strip().lower() for row in cursor.fetchall() if row[0].strip()]
+            values = [value.strip().lower() for value in values_by_book.get(book_id, ()) if value.strip()]
 
             for val in values:
                 # Split Subject field by comma
@@ -120,45 +285,160 @@ for idx, (book_id, title, path, comments) in enumerate(books, start=1):
                             if val_clean in vocabulary_parser[field_name]["AI"]:
                                 book_labels.setdefault("AI_flag", set()).add(field_name)
 
-                    dynamic_vocab[field_name].add(val_clean)
                     book_labels.setdefault(field_name, set()).add(val_clean)
-                    label_frequency[(field_name, val_clean)] += 1
-                    flat_label_index[val_clean].append(str(book_id))
+                    book_occurrences.append((field_name, val_clean))
 
         except Exception as e:
             print(f"⚠️ Skipping field {field_name} for book {book_id}: {e}")
             continue
 
-    if book_labels:
-        label_map[str(book_id)] = {
-            "title": title.strip(),
-            "author": author_folder,
-            "labels_by_field": {k: sorted(v) for k, v in book_labels.items()},
-            "series": series_name,
-            "description": book_description
-        }
-        print(f"[{idx}/{len(books)}] ✅ {book_id} — Author: {author_folder} — {sum(len(v) for v in book_labels.values())} labels collected")
+    if not book_labels:
+        return None, book_occurrences
+    return {
+        "title": title.strip(),
+        "author": author_folder,
+        "labels_by_field": {k: sorted(v) for k, v in book_labels.items()},
+        "series": series_name,
+        "description": book_description
+    }, book_occurrences
 
-# === EXPORT DYNAMIC VOCABULARY ===
-with open(DYNAMIC_VOCAB_PATH, "w", encoding="utf-8") as f:
-    json.dump({k: sorted(v) for k, v in dynamic_vocab.items()}, f, indent=2, ensure_ascii=False)
-print(f"\n📚 Dynamic vocabulary saved to: {DYNAMIC_VOCAB_PATH}")
+# === LABEL BOOKS, IN PARALLEL WITH --jobs ===
+def label_shard(cursor, book_ids):
+    """(book id, record, occurrences) for the given books, in id order."""
+    books, series_by_book, field_values = read_books(cursor, book_ids)
+    return [(book_id, *label_book(book_id, title, path, comments, series_by_book, field_values))
+            for book_id, title, path, comments in books]
+
+def label_shard_worker(book_ids):
+    """Pool worker: label_shard() over the worker's own read-only connection."""
+    shard_conn = sqlite3.connect(f"file:{CALIBRE_DB_PATH}?mode=ro", uri=True)
+    try:
+        shard_conn.execute("BEGIN")
+        return label_shard(shard_conn.cursor(), book_ids)
+    finally:
+        shard_conn.close()
+
+def labelled_books(book_ids):
+    """
+    (book id, record, occurrences) for book_ids, in id order, labelled
+    SHARD_BOOKS at a time. With --jobs the shards go to a pool of processes
+    and their results are merged back in order, so the export doesn't
+    depend on the job count.
+    """
+    shards = [book_ids[i:i + SHARD_BOOKS] for i in range(0, len(book_ids), SHARD_BOOKS)]
+    if JOBS == 1 or len(shards) < 2 or "fork" not in multiprocessing.get_all_start_methods():
+        for shard in shards:
+            yield from label_shard(cursor, shard)
+        return
+    # fork: workers inherit the parser and schema, as this script can't be re-imported
+    with multiprocessing.get_context("fork").Pool(min(JOBS, len(shards))) as pool:
+        for shard in pool.imap(label_shard_worker, shards):
+            yield from shard
+
+# === PREVIOUS RECORDS ===
+def previous_record(book_id):
+    """
+    The previous export's record of an unchanged book (None if it had none).
+    The old label map is in book order too, so it is read alongside the new
+    one: the records of changed and deleted books are skipped on the way.
+    """
+    global next_previous
+    while next_previous is not None and int(next_previous[0]) < book_id:
+        next_previous = next(previous_records, None)
+    if next_previous is not None and int(next_previous[0]) == book_id:
+        return next_previous[1]
+    return None
+
+next_previous = next(previous_records, None)
 
 # === EXPORT SEMANTIC LABEL MAP ===
-with open(OUTPUT_LABEL_MAP, "w", encoding="utf-8") as f:
-    json.dump(label_map, f, indent=2, ensure_ascii=False)
+# Records are streamed out as books are labelled, in book order (patched books
+# between the previous export's unchanged ones, which are streamed from the old
+# file), and aggregated on the way; the label map itself is never held in memory
+postings = defaultdict(list)  # (field, label) -> book ids, for the fingerprints
+book_fingerprints = {}
+export_occurrences = {}
+print(f"🔍 Scanning {len(selected_ids)} books...\n")
+labelled = labelled_books(selected_ids)
+next_labelled = next(labelled, None)
+idx = 0
+with ExportWriter(OUTPUT_LABEL_MAP, OUTPUT_FORMAT) as label_map_writer:
+    for book_id in all_book_ids:
+        key = str(book_id)
+        if next_labelled is not None and next_labelled[0] == book_id:
+            _, record, book_occurrences = next_labelled
+            next_labelled = next(labelled, None)
+            idx += 1
+            if record:
+                print(f"[{idx}/{len(selected_ids)}] ✅ {book_id} — Author: {record['author']} — {sum(len(v) for v in record['labels_by_field'].values())} labels collected")
+        else:
+            # unchanged since the previous export
+            record = previous_record(book_id)
+            book_occurrences = occurrences.pop(key, None)
+
+        if book_occurrences:
+            export_occurrences[key] = book_occurrences
+            for field_name, val_clean in book_occurrences:
+                dynamic_vocab[field_name].add(val_clean)
+                label_frequency[(field_name, val_clean)] += 1
+                posting = flat_label_index[val_clean]
+                if not posting or posting[-1] != key:  # a book is listed once per label
+                    posting.append(key)
+
+        if record:
+            label_map_writer.write(key, record)
+            for field, labels in record["labels_by_field"].items():
+                for label in labels:
+                    postings[(field, label)].append(key)
+            record_text = json.dumps(record, sort_keys=True, ensure_ascii=False)
+            book_fingerprints[key] = hashlib.sha1(record_text.encode("utf-8")).hexdigest()[:16]
 print(f"\n✅ Semantic label map saved to: {OUTPUT_LABEL_MAP}")
 
+# === EXPORT DYNAMIC VOCABULARY ===
+with ExportWriter(DYNAMIC_VOCAB_PATH, OUTPUT_FORMAT) as writer:
+    writer.update({k: sorted(v) for k, v in dynamic_vocab.items()})
+print(f"\n📚 Dynamic vocabulary saved to: {DYNAMIC_VOCAB_PATH}")
+
 # === EXPORT LABEL FREQUENCY MAP ===
-with open(FREQUENCY_MAP_PATH, "w", encoding="utf-8") as f:
-    json.dump({f"{field}:{label}": count for (field, label), count in label_frequency.items()}, f, indent=2, ensure_ascii=False)
+with ExportWriter(FREQUENCY_MAP_PATH, OUTPUT_FORMAT) as writer:
+    writer.update({f"{field}:{label}": count for (field, label), count in label_frequency.items()})
 print(f"\n📈 Label frequency map saved to: {FREQUENCY_MAP_PATH}")
 
 # === EXPORT FLAT LABEL INDEX ===
-with open(FLAT_INDEX_PATH, "w", encoding="utf-8") as f:
-    json.dump(flat_label_index, f, indent=2, ensure_ascii=False)
+with ExportWriter(FLAT_INDEX_PATH, OUTPUT_FORMAT) as writer:
+    writer.update(flat_label_index)
 print(f"\n🔁 Flat label index saved to: {FLAT_INDEX_PATH}")
 
+# === EXPORT LABEL FINGERPRINTS ===
+# Content hashes of every (field, label) posting and every book record, used by
+# ComboUsageTracker to drop only the cached combos that touch changed data.
+label_fingerprints = defaultdict(dict)
+for (field, label), book_ids in postings.items():
+    posting = "\n".join(sorted(book_ids))
+    label_fingerprints[field][label] = hashlib.sha1(posting.encode("utf-8")).hexdigest()[:16]
+
+# fingerprints and export state are only read by programs: never indented
+machine_format = "compact" if OUTPUT_FORMAT == "json" else OUTPUT_FORMAT
+with ExportWriter(FINGERPRINTS_PATH, machine_format) as writer:
+    writer.update({"labels": label_fingerprints, "books": book_fingerprints})
+print(f"\n🧬 Label fingerprints saved to: {FINGERPRINTS_PATH}")
+
+# === SAVE EXPORT STATE ===
+# What --incremental needs to patch this export next time; written before the
+# timestamp, which marks the export as complete
+with ExportWriter(EXPORT_STATE_PATH, machine_format) as writer:
+    writer.update({
+        "version": EXPORT_STATE_VERSION,
+        "db": os.path.abspath(CALIBRE_DB_PATH),
+        "settings": settings_hash,
+        "last_modified": high_water_mark,
+        "book_ids": all_book_ids,
+        "values": value_snapshot,
+        "occurrences": export_occurrences
+    })
+conn.close()
+print(f"\n🗂️ Export state saved to: {EXPORT_STATE_PATH}")
+
 # === SAVE METADATA TIMESTAMP ===
 import time
 METADATA_TIMESTAMP_PATH = os.path.join(os.path.dirname(OUTPUT_LABEL_MAP), "metadata_timestamp.json")
@@ -1,6 +1,7 @@
 import json
 import subprocess
 import os
+from ExportWriter import read_export
 
 # === CONFIG ===
 library_path = "/srv/dev-disk-by-uuid-2856cdb9-5991-47dc-886b-1be20f8c2993/ArkVault/Calibre Library"
@@ -13,8 +14,7 @@ affected_path = "affected_books.json"
 
 # === STEP 1: Find globally overlapping labels ===
 def find_duplicate_labels():
-    with open(vocab_path, "r", encoding="utf-8") as f:
-        vocab = json.load(f)
+    vocab = read_export(vocab_path)
 
     label_fields = {}
     for field, labels in vocab.items():
@@ -30,8 +30,7 @@ def find_duplicate_labels():
 def trace_books():
     with open(overlap_path, "r", encoding="utf-8") as f:
         overlapping = json.load(f)
-    with open(semantic_map_path, "r", encoding="utf-8") as f:
-        all_books = json.load(f)
+    all_books = read_export(semantic_map_path)
 
     affected = {}
     for book_id, info in all_books.items():
@@ -77,8 +76,7 @@ def resolve_conflicts():
 
     with open(affected_path, "r", encoding="utf-8") as f:
         affected = json.load(f)
-    with open(semantic_map_path, "r", encoding="utf-8") as f:
-        all_books = json.load(f)
+    all_books = read_export(semantic_map_path)
     with open(overlap_path, "r", encoding="utf-8") as f:
         overlapping = json.load(f)
 